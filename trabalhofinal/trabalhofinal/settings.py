@@ -125,4 +125,54 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 MEDIA_URL = 'media/'
-MEDIA_ROOT = BASE_DIR / 'media'
\ No newline at end of file
+MEDIA_ROOT = BASE_DIR / 'media'
+# Uploads mantidos em MEDIA_ROOT/uploads; os mais antigos (e os caches dos
+# datasets que só eles usavam) são apagados; None desliga o limite.
+UPLOADS_MAX_FILES = 3
+
+# Análise: faixas de processamento por tamanho do upload
+# Arquivos até os limites "SMALL" recebem o relatório completo; até os limites
+# "MEDIUM" recebem gráficos amostrados e estatísticas aproximadas; acima disso
+# apenas um perfil calculado em streaming (com opção de gerar o completo em
+# segundo plano).
+
+ANALYSIS_SMALL_MAX_ROWS = 50_000
+ANALYSIS_SMALL_MAX_BYTES = 10 * 1024 * 1024
+ANALYSIS_MEDIUM_MAX_ROWS = 1_000_000
+ANALYSIS_MEDIUM_MAX_BYTES = 200 * 1024 * 1024
+ANALYSIS_SAMPLE_ROWS = 20_000
+ANALYSIS_STREAM_CHUNK_ROWS = 100_000
+ANALYSIS_BACKGROUND_WORKERS = 1
+
+# Acima deste número de linhas, contagens, distintos e quantis da análise são
+# calculados com sketches (HyperLogLog, Misra-Gries, t-digest) por bloco.
+ANALYSIS_SKETCH_MIN_ROWS = 200_000
+ANALYSIS_SKETCH_WORKERS = 1
+
+# Machine Learning: acima destes limites (linhas de treino / colunas após o
+# one-hot), KNN e SVM trocam para motores escaláveis; acima de
+# ML_MAX_TRAIN_ROWS o treino é feito numa subamostra estratificada.
+ML_SVM_MAX_ROWS = 10_000
+ML_KNN_MAX_ROWS = 50_000
+ML_SCALE_MAX_FEATURES = 200
+ML_MAX_TRAIN_ROWS = 200_000
+ML_NYSTROEM_COMPONENTS = 300
+ML_KNN_SVD_COMPONENTS = 50
+# KD-trees só ganham da força bruta com poucas dimensões; acima disto o KNN
+# de bases grandes projeta as colunas com SVD e busca em força bruta.
+ML_KNN_KDTREE_MAX_FEATURES = 15
+
+# Gráficos: "interativo" (Plotly embutido na página) ou "estatico" (imagens
+# renderizadas num pool de processos e servidas por URL, com cache no
+# navegador). O usuário pode alternar com ?modo=estatico / ?modo=interativo.
+# Figuras Plotly estáticas exigem o pacote opcional kaleido.
+ANALYSIS_RENDER_MODE = "interativo"
+ANALYSIS_STATIC_FORMAT = "png"  # "png", "svg" ou "webp"
+ANALYSIS_RENDER_WORKERS = 2
+
+# Perfil de desempenho: com True, toda requisição de análise/predição é
+# perfilada; senão, só as de usuários staff com ?perfil=1. Os perfis ficam
+# em media/datasets/<hash>/perfis/ e são listados em /perfis/.
+ANALYSIS_PROFILING = False
+ANALYSIS_PROFILING_INTERVAL = 0.005  # segundos entre amostras de pilha
+ANALYSIS_PROFILING_TOP = 30
@@ -4,22 +4,132 @@ import plotly.express as px
 import plotly.graph_objects as go
 import io
 import base64
+import hashlib
+
+from .dedup import drop_duplicate_rows
+from .sketches import sketch_chunks, split_frame
 
 MAX_CATEGORIES_FOR_PIE = 10
 MIN_CATEGORIES_FOR_PIE = 2
 UNIQUE_THRESHOLD_FOR_CATEGORICAL = 20
 
 
+def clean_column_name(col) -> str:
+    return str(col).strip().lower().replace(" ", "_")
+
+
+def plot_fingerprint(*inputs) -> str:
+    """
+    Impressão digital dos dados de entrada de um gráfico: objetos do pandas
+    entram pelo hash de cada linha (e pelos rótulos), o resto pelo `repr`.
+    """
+    digest = hashlib.sha1()
+    for value in inputs:
+        if isinstance(value, (pd.Series, pd.DataFrame)):
+            labels = value.columns if isinstance(value, pd.DataFrame) else value.name
+            digest.update(repr(labels).encode())
+            digest.update(pd.util.hash_pandas_object(value).to_numpy().tobytes())
+        else:
+            digest.update(repr(value).encode())
+    return digest.hexdigest()
+
+
+def clean_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Parte da limpeza que trata cada coluna isoladamente: nomes limpos e
+    conversão para número das colunas de texto que são numéricas.
+    """
+    df.columns = [clean_column_name(col) for col in df.columns]
+
+    for col in df.columns:
+        if df[col].dtype == "object":
+            try:
+                df[col] = pd.to_numeric(df[col])
+            except (ValueError, TypeError):
+                pass
+
+    return df
+
+
+def clean_dataframe(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Limpeza usada pelo DataAnalyzer, disponível também para quem só precisa
+    dos dados limpos. O cache colunar de `lazy_dataset` faz as mesmas etapas
+    e guarda o resultado da deduplicação.
+    """
+    df, _ = drop_duplicate_rows(clean_columns(df))
+    return df
+
+
 class DataAnalyzer:
-    def __init__(self, df: pd.DataFrame):
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        sample_size: int | None = None,
+        sketch_min_rows: int | None = None,
+        sketch_chunk_rows: int = 100_000,
+        sketch_workers: int = 1,
+        cleaned: bool = False,
+        dataset=None,
+        stats=None,
+        figure_cache: dict | None = None,
+        renderer=None,
+    ):
         self.df_raw = df
-        self.df = self.clean_data(df.copy())
+        self.df = df if cleaned else self.clean_data(df.copy())
+        self.total_rows = len(self.df)
+        self.is_sampled = False
+        self.sketches = {}
+        # `stats`: estatísticas combináveis já atualizadas (re-análise
+        # incremental); `figure_cache`: gráficos anteriores por impressão
+        # digital dos dados de entrada, reaproveitados se nada mudou.
+        self.stats = stats
+        self.figure_cache = figure_cache or {}
+        # `renderer`: modo estático (`rendering.StaticRenderer`), em que as
+        # figuras viram arquivos de imagem referenciados por URL.
+        self.renderer = renderer
+        self.reused_plots = 0
+        self.rendered_plots = 0
+        if sketch_min_rows and self.total_rows >= sketch_min_rows:
+            # Bases grandes: contagens, distintos e quantis vêm de sketches
+            # calculados por bloco sobre todas as linhas (antes da amostragem).
+            # Bases menores ficam com as estatísticas exatas, mesmo quando
+            # há `stats` de uma re-análise incremental.
+            if stats is not None:
+                self.sketches = {
+                    c: stats.sketches[c] for c in self.df.columns if c in stats.sketches
+                }
+            elif dataset is not None:
+                # Os workers abrem as colunas do cache do dataset em vez de
+                # receber cada bloco serializado.
+                self.sketches = dataset.sketch(
+                    self.df.columns, sketch_chunk_rows, sketch_workers
+                )
+            else:
+                self.sketches = sketch_chunks(
+                    split_frame(self.df, sketch_chunk_rows), workers=sketch_workers
+                )
+        if sample_size and len(self.df) > sample_size:
+            # Faixa "média": gráficos e estatísticas são calculados sobre uma
+            # amostra aleatória (reprodutível) das linhas limpas.
+            self.df = self.df.sample(n=sample_size, random_state=42).reset_index(
+                drop=True
+            )
+            self.is_sampled = True
         self.numeric_cols = []
         self.categorical_cols = []
         self.date_cols = []
         self.geo_cols = []
         self._identify_column_types()
 
+    @classmethod
+    def from_dataset(cls, dataset, columns=None, **kwargs) -> "DataAnalyzer":
+        """
+        Cria o analisador a partir de um `LazyDataset` (dados já limpos),
+        carregando apenas as colunas em `columns` (todas, se None).
+        """
+        return cls(dataset.load(columns), cleaned=True, dataset=dataset, **kwargs)
+
     def _fig_to_base64(self, fig) -> str:
         if isinstance(fig, plt.Figure):
             buf = io.BytesIO()
@@ -32,25 +142,52 @@ class DataAnalyzer:
             return fig.to_html(full_html=False, include_plotlyjs="cdn")
         return ""
 
+    def _plot(self, section: str, title: str, inputs, render) -> dict:
+        """
+        Monta o dict de um gráfico; `render()` só é chamado se não houver um
+        gráfico com os mesmos dados de entrada em `figure_cache`.
+        """
+        fingerprint = plot_fingerprint(section, title, self.render_mode, *inputs)
+        cached = self.figure_cache.get(fingerprint)
+        if cached is not None:
+            self.reused_plots += 1
+            return dict(cached)
+        self.rendered_plots += 1
+        fields = render()
+        if isinstance(fields, str):
+            fields = {"html": fields}
+        return {
+            "section": section,
+            "title": title,
+            **fields,
+            "fingerprint": fingerprint,
+        }
+
+    @property
+    def render_mode(self) -> str:
+        if self.renderer is None:
+            return "interativo"
+        return self.renderer.variant
+
+    def _render_fig(self, fig) -> dict:
+        if self.renderer is not None:
+            fields = self.renderer.render(fig)
+            if fields is not None:
+                return fields
+        return {"html": self._fig_to_base64(fig)}
+
     def clean_data(self, df: pd.DataFrame) -> pd.DataFrame:
         """
         Limpeza básica: limpa nomes de colunas e remove duplicados.
         A lógica de conversão de tipo foi movida para _identify_column_types.
         O dropna() foi removido para permitir que os gráficos e o ML lidem com NaNs.
         """
-        df.columns = [str(col).strip().lower().replace(" ", "_") for col in df.columns]
-
-        for col in df.columns:
-            if df[col].dtype == "object":
-                try:
-                    df[col] = pd.to_numeric(df[col])
-                except (ValueError, TypeError):
-                    pass
+        return clean_dataframe(df)
 
-        df.drop_duplicates(inplace=True)
-        df.reset_index(drop=True, inplace=True)
-
-        return df
+    def _nunique(self, col) -> int:
+        if col in self.sketches:
+            return self.sketches[col].nunique()
+        return self.df[col].nunique()
 
     def _identify_column_types(self):
         """
@@ -71,7 +208,7 @@ class DataAnalyzer:
 
         for col in self.df.columns:
             dtype = self.df[col].dtype
-            nunique = self.df[col].nunique()
+            nunique = self._nunique(col)
 
             # Tenta converter para data se for 'object' e tiver keywords
             if dtype == "object" and any(keyword in col for keyword in date_keywords):
@@ -118,35 +255,67 @@ class DataAnalyzer:
 
         for col in self.categorical_cols:
             try:
-                if self.df[col].nunique() == 0:
+                nunique = self._nunique(col)
+                if nunique == 0:
                     continue
 
+                sketch = self.sketches.get(col)
+                if sketch is not None:
+                    counts = sketch.heavy_hitters.top(20).sort_values()
+                else:
+                    counts = self.df[col].value_counts().nlargest(20).sort_values()
+
                 # Gráfico de Barras para Top 20
-                counts = self.df[col].value_counts().nlargest(20).sort_values()
                 if not counts.empty:
-                    fig_bar = px.bar(
-                        counts, orientation="h", title=f'Contagem de "{col}" (Top 20)'
-                    )
+                    title = f'Contagem por "{col}"'
+                    if sketch is not None and not sketch.heavy_hitters.is_exact:
+                        title += (
+                            " (aproximada: cada barra pode estar subestimada em"
+                            f" até {sketch.heavy_hitters.error})"
+                        )
                     plots.append(
-                        {
-                            "section": "Análise Categórica",
-                            "title": f'Contagem por "{col}"',
-                            "html": self._fig_to_base64(fig_bar),
-                        }
+                        self._plot(
+                            "Análise Categórica",
+                            title,
+                            [counts],
+                            lambda: self._render_fig(
+                                px.bar(
+                                    counts,
+                                    orientation="h",
+                                    title=f'Contagem de "{col}" (Top 20)',
+                                )
+                            ),
+                        )
                     )
 
                 # Gráfico de Pizza se houver poucas categorias
-                nunique = self.df[col].nunique()
                 if MIN_CATEGORIES_FOR_PIE <= nunique <= MAX_CATEGORIES_FOR_PIE:
-                    fig_pie = px.pie(
-                        self.df, names=col, title=f'Distribuição em Pizza de "{col}"'
+
+                    def render_pie():
+                        if sketch is not None:
+                            fig_pie = px.pie(
+                                names=counts.index,
+                                values=counts.values,
+                                title=f'Distribuição em Pizza de "{col}"',
+                            )
+                        else:
+                            fig_pie = px.pie(
+                                self.df,
+                                names=col,
+                                title=f'Distribuição em Pizza de "{col}"',
+                            )
+                        return self._render_fig(fig_pie)
+
+                    pie_counts = (
+                        counts if sketch is not None else self.df[col].value_counts()
                     )
                     plots.append(
-                        {
-                            "section": "Análise Categórica",
-                            "title": f'Pizza de "{col}"',
-                            "html": self._fig_to_base64(fig_pie),
-                        }
+                        self._plot(
+                            "Análise Categórica",
+                            f'Pizza de "{col}"',
+                            [pie_counts],
+                            render_pie,
+                        )
                     )
             except Exception as e:
                 print(f"Error generating basic plot for {col}: {e}")
@@ -155,33 +324,48 @@ class DataAnalyzer:
             try:
                 # Histograma e Boxplot
                 if not self.df[col].empty:
-                    fig_hist = px.histogram(
-                        self.df,
-                        x=col,
-                        marginal="box",
-                        title=f'Histograma e Boxplot de "{col}"',
-                    )
                     plots.append(
-                        {
-                            "section": "Análise Numérica",
-                            "title": f'Distribuição de "{col}"',
-                            "html": self._fig_to_base64(fig_hist),
-                        }
+                        self._plot(
+                            "Análise Numérica",
+                            f'Distribuição de "{col}"',
+                            [self.df[col].dropna()],
+                            lambda: self._render_fig(
+                                px.histogram(
+                                    self.df,
+                                    x=col,
+                                    marginal="box",
+                                    title=f'Histograma e Boxplot de "{col}"',
+                                )
+                            ),
+                        )
                     )
 
                 # Tabela de Estatísticas
-                stats_html = (
-                    self.df[col]
-                    .describe()
-                    .to_frame()
-                    .to_html(classes="table table-striped table-hover")
-                )
+                sketch = self.sketches.get(col)
+                if sketch is not None and sketch.numeric:
+                    stats = sketch.describe().rename(col)
+                else:
+                    stats = self.df[col].describe()
+                title = f'Estatísticas Descritivas para "{col}"'
+                if sketch is not None and sketch.numeric:
+                    title += (
+                        f" (todas as {self.total_rows} linhas; quantis aproximados,"
+                        f" erro de posição até ±{sketch.quantiles.rank_error:.1%})"
+                    )
+                elif self.is_sampled:
+                    title += (
+                        f" (aproximadas: amostra de {len(self.df)}"
+                        f" de {self.total_rows} linhas)"
+                    )
                 plots.append(
-                    {
-                        "section": "Análise Numérica",
-                        "title": f'Estatísticas Descritivas para "{col}"',
-                        "html": stats_html,
-                    }
+                    self._plot(
+                        "Análise Numérica",
+                        title,
+                        [stats],
+                        lambda: stats.to_frame().to_html(
+                            classes="table table-striped table-hover"
+                        ),
+                    )
                 )
             except Exception as e:
                 print(f"Error generating basic plot for {col}: {e}")
@@ -194,38 +378,49 @@ class DataAnalyzer:
         for col in self.numeric_cols:
             try:
                 if not self.df[col].empty:
-                    fig_violin = px.violin(
-                        self.df,
-                        y=col,
-                        box=True,
-                        points="all",
-                        title=f'Distribuição (Violin Plot) de "{col}"',
-                    )
                     plots.append(
-                        {
-                            "section": "Análise Avançada Univariada",
-                            "title": f'Violin Plot de "{col}"',
-                            "html": self._fig_to_base64(fig_violin),
-                        }
+                        self._plot(
+                            "Análise Avançada Univariada",
+                            f'Violin Plot de "{col}"',
+                            [self.df[col].dropna()],
+                            lambda: self._render_fig(
+                                px.violin(
+                                    self.df,
+                                    y=col,
+                                    box=True,
+                                    points="all",
+                                    title=f'Distribuição (Violin Plot) de "{col}"',
+                                )
+                            ),
+                        )
                     )
             except Exception as e:
                 print(f"Error generating violin plot for {col}: {e}")
 
         if len(self.numeric_cols) > 1:
             try:
-                corr = self.df[self.numeric_cols].corr()
-                fig_heatmap = px.imshow(
-                    corr,
-                    text_auto=True,
-                    aspect="auto",
-                    title="Heatmap de Correlação Numérica",
-                )
+                if self.stats is not None and set(self.numeric_cols) <= set(
+                    self.stats.correlation.columns
+                ):
+                    corr = self.stats.correlation.corr().loc[
+                        self.numeric_cols, self.numeric_cols
+                    ]
+                else:
+                    corr = self.df[self.numeric_cols].corr()
                 plots.append(
-                    {
-                        "section": "Análise Avançada Bivariada",
-                        "title": "Heatmap de Correlação",
-                        "html": self._fig_to_base64(fig_heatmap),
-                    }
+                    self._plot(
+                        "Análise Avançada Bivariada",
+                        "Heatmap de Correlação",
+                        [corr],
+                        lambda: self._render_fig(
+                            px.imshow(
+                                corr,
+                                text_auto=True,
+                                aspect="auto",
+                                title="Heatmap de Correlação Numérica",
+                            )
+                        ),
+                    )
                 )
 
                 if len(self.numeric_cols) > 1:
@@ -236,19 +431,21 @@ class DataAnalyzer:
                     for pair in top_pairs:
                         col1, col2 = pair
                         if col1 in self.df.columns and col2 in self.df.columns:
-                            fig_scatter = px.scatter(
-                                self.df,
-                                x=col1,
-                                y=col2,
-                                trendline="ols",
-                                title=f"Correlação: {col1} vs {col2}",
-                            )
                             plots.append(
-                                {
-                                    "section": "Análise Avançada Bivariada",
-                                    "title": f"Scatter: {col1} vs {col2}",
-                                    "html": self._fig_to_base64(fig_scatter),
-                                }
+                                self._plot(
+                                    "Análise Avançada Bivariada",
+                                    f"Scatter: {col1} vs {col2}",
+                                    [self.df[[col1, col2]].dropna()],
+                                    lambda col1=col1, col2=col2: self._render_fig(
+                                        px.scatter(
+                                            self.df,
+                                            x=col1,
+                                            y=col2,
+                                            trendline="ols",
+                                            title=f"Correlação: {col1} vs {col2}",
+                                        )
+                                    ),
+                                )
                             )
             except Exception as e:
                 print(f"Error generating advanced bivariate plots: {e}")
@@ -282,7 +479,7 @@ class DataAnalyzer:
                 return {
                     "section": "Análise Geográfica",
                     "title": "Mapa de Dispersão Geográfica",
-                    "html": self._fig_to_base64(fig_map),
+                    **self._render_fig(fig_map),
                 }
             except Exception as e:
                 print(f"Error generating geo map: {e}")
@@ -306,7 +503,7 @@ class DataAnalyzer:
                     return {
                         "section": "Análise Geográfica",
                         "title": f'Contagem por "{geo_col_bar}"',
-                        "html": self._fig_to_base64(fig_bar_geo),
+                        **self._render_fig(fig_bar_geo),
                     }
             except Exception as e:
                 print(f"Error generating geo bar chart: {e}")
@@ -317,35 +514,44 @@ class DataAnalyzer:
         plots = []
         for col in self.date_cols:
             try:
-                df_temp = self.df.copy()
-                df_temp[col] = pd.to_datetime(df_temp[col], errors="coerce").dropna()
-
-                if df_temp.empty:
-                    continue
-
-                time_series = df_temp.set_index(col).resample("D").size()
+                if self.stats is not None and col in self.stats.daily:
+                    time_series = self.stats.daily_counts(col)
+                else:
+                    df_temp = self.df.copy()
+                    df_temp[col] = pd.to_datetime(
+                        df_temp[col], errors="coerce"
+                    ).dropna()
+
+                    if df_temp.empty:
+                        continue
+
+                    time_series = df_temp.set_index(col).resample("D").size()
                 time_series = time_series[time_series > 0]
 
                 if time_series.empty:
                     continue
 
-                fig_line = px.line(
-                    time_series,
-                    x=time_series.index,
-                    y=time_series.values,
-                    title=f"Evolução Temporal Diária ({col})",
-                    markers=True,
-                )
-                fig_line.update_layout(xaxis_title="Data", yaxis_title="Contagem")
+                def render_line(time_series=time_series, col=col):
+                    fig_line = px.line(
+                        time_series,
+                        x=time_series.index,
+                        y=time_series.values,
+                        title=f"Evolução Temporal Diária ({col})",
+                        markers=True,
+                    )
+                    fig_line.update_layout(xaxis_title="Data", yaxis_title="Contagem")
+                    return self._render_fig(fig_line)
+
                 plots.append(
-                    {
-                        "section": "Análise Temporal",
-                        "title": f"Evolução por Data ({col})",
-                        "html": self._fig_to_base64(fig_line),
-                    }
+                    self._plot(
+                        "Análise Temporal",
+                        f"Evolução por Data ({col})",
+                        [time_series],
+                        render_line,
+                    )
                 )
 
-                if len(time_series) > 7:
+                def render_ma(time_series=time_series, col=col):
                     time_series_ma = time_series.rolling(window=7).mean()
                     fig_ma = go.Figure()
                     fig_ma.add_trace(
@@ -369,15 +575,74 @@ class DataAnalyzer:
                         xaxis_title="Data",
                         yaxis_title="Contagem",
                     )
+                    return self._render_fig(fig_ma)
+
+                if len(time_series) > 7:
                     plots.append(
-                        {
-                            "section": "Análise Temporal",
-                            "title": f"Tendência com Média Móvel ({col})",
-                            "html": self._fig_to_base64(fig_ma),
-                        }
+                        self._plot(
+                            "Análise Temporal",
+                            f"Tendência com Média Móvel ({col})",
+                            [time_series],
+                            render_ma,
+                        )
                     )
 
             except Exception as e:
                 print(f"Error generating temporal plot for {col}: {e}")
 
-        return plots
\ No newline at end of file
+        return plots
+
+
+def profile_stream(chunks, workers: int = 1) -> list[dict]:
+    """
+    Perfil leve de um CSV grande, calculado em streaming (um iterável de
+    blocos de linhas) com sketches: contagem, nulos, distintos aproximados
+    e, para colunas numéricas, mínimo/quantis/máximo/média/desvio. A memória
+    usada não depende do tamanho do arquivo.
+    """
+
+    def cleaned_chunks():
+        for chunk in chunks:
+            chunk.columns = [clean_column_name(col) for col in chunk.columns]
+            yield chunk
+
+    sketches = sketch_chunks(cleaned_chunks(), workers=workers)
+
+    total_rows = 0
+    rows = []
+    for col, sketch in sketches.items():
+        total_rows = max(total_rows, sketch.rows)
+        nunique = sketch.nunique()
+        distinct = str(nunique)
+        if not sketch.heavy_hitters.is_exact:
+            distinct = f"≈{nunique} (±{sketch.distinct.relative_error:.1%})"
+        row = {
+            "coluna": col,
+            "tipo": "numérica" if sketch.numeric else "texto/categórica",
+            "não nulos": sketch.rows - sketch.nulls,
+            "nulos": sketch.nulls,
+            "distintos": distinct,
+        }
+        if sketch.numeric and sketch.moments.n:
+            stats = sketch.describe()
+            row.update(
+                {
+                    "mínimo": stats["min"],
+                    "mediana (aprox.)": stats["50%"],
+                    "máximo": stats["max"],
+                    "média": stats["mean"],
+                    "desvio padrão": stats["std"],
+                }
+            )
+        rows.append(row)
+
+    profile_html = pd.DataFrame(rows).to_html(
+        classes="table table-striped table-hover", index=False, na_rep=""
+    )
+    return [
+        {
+            "section": "Perfil do Arquivo",
+            "title": f"Perfil por coluna ({total_rows} linhas lidas em streaming)",
+            "html": profile_html,
+        }
+    ]
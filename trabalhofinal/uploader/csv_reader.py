@@ -0,0 +1,238 @@
+"""
+Leitura de CSV centralizada: detecta codificação, delimitador, separador
+decimal e cabeçalho a partir de um pequeno trecho inicial do arquivo,
+escolhe o motor mais rápido disponível (pyarrow, multithread, se instalado;
+senão o motor C do pandas), lê só as colunas pedidas e informa quantas
+linhas malformadas foram ignoradas.
+"""
+
+import codecs
+import csv
+import re
+import warnings
+
+import pandas as pd
+
+from .datasets import READ_BLOCK_SIZE
+
+SNIFF_BYTES = 64 * 1024
+CANDIDATE_DELIMITERS = ",;\t|"
+HEADER_SAMPLE_ROWS = 50
+FALLBACK_ENCODINGS = ("cp1252", "latin-1")
+
+try:
+    import pyarrow  # noqa: F401
+
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+_DECIMAL_COMMA = re.compile(r"(?:^|;)\s*-?\d+,\d+\s*(?:;|$)", re.MULTILINE)
+
+
+def _detect_encoding(prefix: bytes) -> str:
+    if prefix.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    try:
+        # final=False: um caractere multibyte cortado no fim do trecho é aceito.
+        codecs.getincrementaldecoder("utf-8")().decode(prefix, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    for encoding in FALLBACK_ENCODINGS:
+        try:
+            prefix.decode(encoding)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return "latin-1"
+
+
+def _is_number(value: str, decimal: str) -> bool:
+    value = value.strip()
+    if decimal == ",":
+        value = value.replace(".", "").replace(",", ".")
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+
+def _looks_headerless(text: str, sep: str, decimal: str) -> bool:
+    """
+    Indica se a primeira linha parece ser de dados e não um cabeçalho. Só
+    há evidência forte quando a primeira linha é toda numérica, como as
+    seguintes (nomes de coluna quase nunca são todos números); em qualquer
+    outro caso o arquivo é tratado como tendo cabeçalho, como sempre foi.
+    """
+    rows = [row for row in csv.reader(text.splitlines(), delimiter=sep) if row]
+    if len(rows) < 2:
+        return False
+    first, rest = rows[0], rows[1 : HEADER_SAMPLE_ROWS + 1]
+    return all(cell.strip() and _is_number(cell, decimal) for cell in first) and all(
+        _is_number(value, decimal) for row in rest for value in row if value.strip()
+    )
+
+
+def sniff_csv(full_fs_path) -> dict:
+    """
+    Analisa o início do arquivo e devolve o formato detectado:
+    `encoding`, `sep`, `decimal` e `header` (True/False).
+    """
+    with open(full_fs_path, "rb") as fh:
+        prefix = fh.read(SNIFF_BYTES)
+
+    encoding = _detect_encoding(prefix)
+    text = prefix.decode(encoding, errors="ignore")
+    # Descarta a última linha, que pode estar cortada.
+    if len(prefix) == SNIFF_BYTES and "\n" in text:
+        text = text[: text.rindex("\n")]
+
+    sep = ","
+    if text.strip():
+        try:
+            sep = csv.Sniffer().sniff(text, delimiters=CANDIDATE_DELIMITERS).delimiter
+        except csv.Error:
+            pass
+
+    # Planilhas brasileiras: ";" como separador e "," como decimal.
+    decimal = "," if sep == ";" and _DECIMAL_COMMA.search(text) else "."
+    # O csv.Sniffer.has_header erra em arquivos só com texto: o padrão é ter
+    # cabeçalho, e só a evidência numérica muda isso.
+    header = not _looks_headerless(text, sep, decimal)
+
+    return {"encoding": encoding, "sep": sep, "decimal": decimal, "header": header}
+
+
+def _read_kwargs(fmt: dict, usecols=None) -> dict:
+    kwargs = {
+        "encoding": fmt["encoding"],
+        "sep": fmt["sep"],
+        "decimal": fmt["decimal"],
+        "header": 0 if fmt["header"] else None,
+    }
+    if usecols is not None:
+        kwargs["usecols"] = list(usecols)
+    return kwargs
+
+
+def _count_skipped(caught) -> int:
+    skipped = 0
+    for warning in caught:
+        if issubclass(warning.category, pd.errors.ParserWarning):
+            # O motor C agrupa várias linhas numa única mensagem.
+            skipped += max(str(warning.message).count("Skipping line"), 1)
+    return skipped
+
+
+def _has_bytes(df: pd.DataFrame) -> bool:
+    for col in df.columns:
+        if df[col].dtype == object and pd.api.types.infer_dtype(
+            df[col], skipna=True
+        ) in ("bytes", "mixed"):
+            if df[col].map(lambda v: isinstance(v, bytes)).any():
+                return True
+    return False
+
+
+def _is_valid_utf8(full_fs_path) -> bool:
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    with open(full_fs_path, "rb") as fh:
+        try:
+            while block := fh.read(READ_BLOCK_SIZE):
+                decoder.decode(block)
+            decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            return False
+    return True
+
+
+def _read(full_fs_path, engine: str, **kwargs):
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always", pd.errors.ParserWarning)
+        df = pd.read_csv(full_fs_path, engine=engine, on_bad_lines="warn", **kwargs)
+    return df, _count_skipped(caught)
+
+
+def read_csv(
+    full_fs_path, usecols=None, nrows: int | None = None, fmt: dict | None = None
+) -> tuple[pd.DataFrame, dict]:
+    """
+    Lê o CSV (ou só as colunas `usecols` / as primeiras `nrows` linhas) e
+    devolve `(df, info)`, onde `info` traz o formato detectado, o motor
+    usado e `skipped_lines` (linhas malformadas ignoradas).
+    """
+    fmt = fmt or sniff_csv(full_fs_path)
+    kwargs = _read_kwargs(fmt, usecols)
+
+    engines = ["c"]
+    if HAS_PYARROW and nrows is None:
+        engines.insert(0, "pyarrow")
+    else:
+        kwargs["nrows"] = nrows
+
+    for engine in engines:
+        try:
+            df, skipped = _read(full_fs_path, engine, **kwargs)
+            if engine == "pyarrow" and _has_bytes(df):
+                # O pyarrow não falha com bytes que não são UTF-8: devolve as
+                # células da coluna como `bytes`.
+                raise UnicodeDecodeError(
+                    fmt["encoding"], b"", 0, 1, "bytes inválidos após o trecho inicial"
+                )
+            break
+        except UnicodeDecodeError:
+            # O trecho inicial era UTF-8 válido, mas o resto do arquivo não.
+            fmt = dict(fmt, encoding=FALLBACK_ENCODINGS[0])
+            kwargs["encoding"] = fmt["encoding"]
+            df, skipped = _read(full_fs_path, "c", **kwargs)
+            engine = "c"
+            break
+        except (ValueError, TypeError) as e:
+            if engine == engines[-1]:
+                raise
+            print(
+                f"Motor {engine} não conseguiu ler {full_fs_path} ({e}); usando outro."
+            )
+
+    if not fmt["header"]:
+        df.columns = [f"coluna_{i + 1}" for i in range(len(df.columns))]
+
+    return df, dict(fmt, engine=engine, skipped_lines=skipped)
+
+
+def iter_csv(full_fs_path, chunksize: int, usecols=None, fmt: dict | None = None):
+    """
+    Lê o CSV em blocos de `chunksize` linhas (motor C, o único com streaming).
+    Um erro de codificação no meio do arquivo chegaria depois de blocos já
+    entregues, então a validade do UTF-8 é conferida antes, em streaming,
+    com o mesmo fallback de `read_csv`.
+    """
+    fmt = fmt or sniff_csv(full_fs_path)
+    if fmt["encoding"] in ("utf-8", "utf-8-sig") and not _is_valid_utf8(full_fs_path):
+        fmt = dict(fmt, encoding=FALLBACK_ENCODINGS[0])
+    kwargs = _read_kwargs(fmt, usecols)
+    for chunk in pd.read_csv(
+        full_fs_path, chunksize=chunksize, on_bad_lines="skip", **kwargs
+    ):
+        if not fmt["header"]:
+            chunk.columns = [f"coluna_{i + 1}" for i in range(len(chunk.columns))]
+        yield chunk
+
+
+def read_csv_tail(
+    full_fs_path, offset: int, names, fmt: dict
+) -> tuple[pd.DataFrame, int]:
+    """
+    Lê apenas as linhas que começam no byte `offset` (ex: linhas acrescentadas
+    ao fim de um arquivo já lido), sem cabeçalho, com as colunas `names`.
+    Devolve `(df, linhas malformadas ignoradas)`.
+    """
+    kwargs = _read_kwargs(dict(fmt, header=False))
+    if fmt.get("engine") == "pyarrow":
+        # Mesmos floats que o pyarrow produziu na leitura completa.
+        kwargs["float_precision"] = "round_trip"
+    with open(full_fs_path, "rb") as fh:
+        fh.seek(offset)
+        return _read(fh, "c", names=list(names), **kwargs)
@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: só o lock entre threads.
+    fcntl = None
+
+READ_BLOCK_SIZE = 1024 * 1024
+UPLOADS_INDEX_FILENAME = "uploads.json"
+UPLOADS_LOCK_FILENAME = "uploads.lock"
+# Chave de dataset: prefixo do sha256 do conteúdo (ver `scan_file`).
+DATASET_KEY = re.compile(r"^[0-9a-f]{32}$")
+
+_index_lock = threading.Lock()
+
+TIER_SMALL = "pequeno"
+TIER_MEDIUM = "medio"
+TIER_LARGE = "grande"
+
+
+def get_tier_limits() -> dict:
+    """
+    Retorna os limites de cada faixa de processamento, lidos do settings.py.
+    """
+    return {
+        TIER_SMALL: {
+            "max_rows": getattr(settings, "ANALYSIS_SMALL_MAX_ROWS", 50_000),
+            "max_bytes": getattr(settings, "ANALYSIS_SMALL_MAX_BYTES", 10 * 1024 * 1024),
+        },
+        TIER_MEDIUM: {
+            "max_rows": getattr(settings, "ANALYSIS_MEDIUM_MAX_ROWS", 1_000_000),
+            "max_bytes": getattr(settings, "ANALYSIS_MEDIUM_MAX_BYTES", 200 * 1024 * 1024),
+        },
+    }
+
+
+def get_analyzer_options() -> dict:
+    """
+    Parâmetros do DataAnalyzer configurados no settings.py.
+    """
+    return {
+        "sketch_min_rows": getattr(settings, "ANALYSIS_SKETCH_MIN_ROWS", 200_000),
+        "sketch_chunk_rows": getattr(settings, "ANALYSIS_STREAM_CHUNK_ROWS", 100_000),
+        "sketch_workers": getattr(settings, "ANALYSIS_SKETCH_WORKERS", 1),
+    }
+
+
+def classify_tier(n_rows: int, n_bytes: int) -> str:
+    """
+    Classifica o upload em pequeno/médio/grande. Basta um dos limites
+    (linhas ou bytes) ser ultrapassado para o arquivo subir de faixa.
+    """
+    limits = get_tier_limits()
+    for tier in (TIER_SMALL, TIER_MEDIUM):
+        if n_rows <= limits[tier]["max_rows"] and n_bytes <= limits[tier]["max_bytes"]:
+            return tier
+    return TIER_LARGE
+
+
+def scan_file(full_fs_path) -> dict:
+    """
+    Percorre o arquivo em blocos (sem carregá-lo inteiro na memória) e
+    devolve o hash do conteúdo, o tamanho em bytes e o número de linhas
+    de dados (sem contar o cabeçalho).
+    """
+    digest = hashlib.sha256()
+    n_bytes = 0
+    n_lines = 0
+    last_byte = b""
+    with open(full_fs_path, "rb") as fh:
+        while True:
+            block = fh.read(READ_BLOCK_SIZE)
+            if not block:
+                break
+            digest.update(block)
+            n_bytes += len(block)
+            n_lines += block.count(b"\n")
+            last_byte = block[-1:]
+
+    if n_bytes and last_byte != b"\n":
+        n_lines += 1
+
+    return {
+        "key": digest.hexdigest()[:32],
+        "n_bytes": n_bytes,
+        "n_rows": max(n_lines - 1, 0),
+    }
+
+
+def dataset_dir(key: str) -> str:
+    """
+    Diretório (dentro do MEDIA_ROOT) onde ficam os artefatos derivados de um
+    dataset: relatórios, caches e afins.
+    """
+    if not DATASET_KEY.match(str(key)):
+        raise ValueError(f"Chave de dataset inválida: {key!r}")
+    path = os.path.join(settings.MEDIA_ROOT, "datasets", key)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _uploads_index_path() -> str:
+    directory = os.path.join(settings.MEDIA_ROOT, "datasets")
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, UPLOADS_INDEX_FILENAME)
+
+
+@contextmanager
+def _locked_index():
+    """
+    Exclusão mútua no índice de uploads entre threads e entre processos
+    (vários workers do servidor, comandos em lote).
+    """
+    with _index_lock:
+        if fcntl is None:
+            yield
+            return
+        lock_path = os.path.join(
+            os.path.dirname(_uploads_index_path()), UPLOADS_LOCK_FILENAME
+        )
+        with open(lock_path, "a") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _read_uploads_index() -> dict:
+    try:
+        with open(_uploads_index_path(), encoding="utf-8") as fh:
+            return json.load(fh)
+    except (IOError, ValueError):
+        return {}
+
+
+def _write_uploads_index(index: dict):
+    path = _uploads_index_path()
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(index, fh)
+    os.replace(tmp_path, path)
+
+
+def uploads_index() -> dict:
+    """Mapa caminho do upload -> chave do dataset dos uploads registrados."""
+    with _locked_index():
+        return _read_uploads_index()
+
+
+def register_upload(key: str, upload_path: str):
+    """
+    Registra que o arquivo enviado `upload_path` usa o dataset `key`. O
+    número de uploads que apontam para uma chave é a contagem de
+    referências dos caches desse dataset.
+    """
+    with _locked_index():
+        index = _read_uploads_index()
+        index[upload_path] = key
+        _write_uploads_index(index)
+
+
+def release_upload(upload_path: str) -> str | None:
+    """
+    Remove o registro de um upload apagado. Se nenhum outro upload usa mais
+    o dataset, apaga o diretório dele inteiro (cache colunar, features,
+    modelos, estatísticas, relatórios e perfis) e devolve a chave.
+    """
+    removed = None
+    with _locked_index():
+        index = _read_uploads_index()
+        key = index.pop(upload_path, None)
+        _write_uploads_index(index)
+        if key is None or key in index.values() or not DATASET_KEY.match(key):
+            return None
+        # Sai do caminho ainda sob o lock, para um novo upload do mesmo
+        # conteúdo não reaproveitar um diretório pela metade; quem tem
+        # arquivos abertos em memmap continua lendo normalmente.
+        directory = os.path.join(settings.MEDIA_ROOT, "datasets", key)
+        if os.path.isdir(directory):
+            removed = f"{directory}.{os.getpid()}.{threading.get_ident()}.removido"
+            os.rename(directory, removed)
+    if removed:
+        shutil.rmtree(removed, ignore_errors=True)
+    return key
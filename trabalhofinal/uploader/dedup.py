@@ -0,0 +1,107 @@
+"""
+Remoção de linhas duplicadas sem comparar todas as células de todas as
+linhas: cada linha recebe uma impressão digital de 64 bits
+(`pd.util.hash_pandas_object`, calculada por blocos) e só as linhas com
+impressão repetida são comparadas, coluna a coluna, com a primeira linha de
+mesma impressão. Colisões (linhas diferentes com a mesma impressão) caem
+numa comparação exata restrita a esse pequeno grupo, então o resultado é
+sempre o mesmo de `drop_duplicates()`.
+
+A máscara de linhas mantidas e as impressões são gravadas junto do cache
+colunar (`lazy_dataset`): a deduplicação roda uma vez por upload e as linhas
+acrescentadas depois são comparadas só com as impressões já guardadas.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .sketches import split_frame
+
+DEDUP_CHUNK_ROWS = 100_000
+
+
+def _normalized(chunk: pd.DataFrame) -> pd.DataFrame:
+    """
+    `0.0` e `-0.0` são iguais para `drop_duplicates()`, mas têm bytes (e
+    hashes) diferentes: somar 0.0 transforma -0.0 em 0.0.
+    """
+    floats = [c for c in chunk.columns if pd.api.types.is_float_dtype(chunk[c])]
+    if not floats:
+        return chunk
+    chunk = chunk.copy(deep=False)
+    for col in floats:
+        chunk[col] = chunk[col] + 0.0
+    return chunk
+
+
+def row_fingerprints(df: pd.DataFrame, chunk_rows: int = DEDUP_CHUNK_ROWS):
+    """Impressão digital de 64 bits de cada linha, ignorando o índice."""
+    if df.empty:
+        return np.empty(0, dtype=np.uint64)
+    return np.concatenate(
+        [
+            pd.util.hash_pandas_object(_normalized(chunk), index=False).to_numpy(
+                dtype=np.uint64
+            )
+            for chunk in split_frame(df, chunk_rows)
+        ]
+    )
+
+
+def _same_rows(df: pd.DataFrame, left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """
+    Compara as linhas `left[i]` e `right[i]` (posições) em todas as colunas,
+    considerando nulos iguais entre si, como `duplicated()`.
+    """
+    same = np.ones(len(left), dtype=bool)
+    for col in df.columns:
+        a = df[col].take(left).reset_index(drop=True)
+        b = df[col].take(right).reset_index(drop=True)
+        equal = (a == b).to_numpy(dtype=bool, na_value=False)
+        same &= equal | (a.isna() & b.isna()).to_numpy()
+    return same
+
+
+def unique_rows_mask(df: pd.DataFrame, fingerprints=None) -> np.ndarray:
+    """
+    Máscara booleana das linhas mantidas (primeira ocorrência de cada linha).
+    `fingerprints` pode ser passado se já tiver sido calculado.
+    """
+    if fingerprints is None:
+        fingerprints = row_fingerprints(df)
+    keep = np.ones(len(fingerprints), dtype=bool)
+    if len(fingerprints) == 0:
+        return keep
+
+    codes, _ = pd.factorize(fingerprints)
+    _, first_of_code = np.unique(codes, return_index=True)
+    first = first_of_code[codes]
+    candidates = np.flatnonzero(first != np.arange(len(codes)))
+    if len(candidates) == 0:
+        return keep
+
+    same = _same_rows(df, candidates, first[candidates])
+    keep[candidates[same]] = False
+
+    collided = np.unique(codes[candidates[~same]])
+    if len(collided):
+        # Impressões iguais para linhas diferentes: o grupo inteiro é
+        # resolvido com a comparação exata do pandas.
+        rows = np.flatnonzero(np.isin(codes, collided))
+        keep[rows] = ~df.take(rows).duplicated().to_numpy()
+    return keep
+
+
+def drop_duplicate_rows(df: pd.DataFrame) -> tuple[pd.DataFrame, dict]:
+    """
+    Remove as linhas duplicadas de `df` e reinicia o índice. Devolve o
+    DataFrame e um dicionário com `mask` (linhas mantidas, sobre as linhas
+    de entrada), `fingerprints` (das linhas mantidas) e `removed`.
+    """
+    fingerprints = row_fingerprints(df)
+    keep = unique_rows_mask(df, fingerprints)
+    removed = int(len(keep) - keep.sum())
+    if removed:
+        df = df[keep]
+    df = df.reset_index(drop=True)
+    return df, {"mask": keep, "fingerprints": fingerprints[keep], "removed": removed}
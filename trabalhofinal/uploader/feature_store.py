@@ -0,0 +1,203 @@
+"""
+Armazenamento de features por dataset: codificação do alvo, índices do
+split 80/20, pré-processador ajustado e matrizes de treino/teste já
+transformadas. Nada disso depende do modelo ou dos hiperparâmetros, então
+trocar de modelo ou ajustar um hiperparâmetro só paga o `fit` do estimador.
+
+Formato em disco (em `datasets/<chave>/features/`):
+
+* `meta.pkl`: LabelEncoder e ColumnTransformer ajustados.
+* `split.npz`: índices e alvos de treino/teste.
+* `X_train` / `X_test`: `.npz` (esparsas) ou `.npy` (densas, abertas com memmap).
+
+O diretório é montado num temporário e renomeado para o lugar, como o cache
+colunar (`lazy_dataset.write_column_cache`): um `.npy` aberto em memmap por
+outro processo nunca é truncado por uma reconstrução.
+"""
+
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import LabelEncoder
+
+from .datasets import dataset_dir
+
+FEATURES_DIRNAME = "features"
+FORMAT_VERSION = 1
+MEMORY_CACHE_SIZE = 2
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+class FeatureSet:
+    def __init__(
+        self,
+        label_encoder,
+        preprocessor,
+        train_idx,
+        test_idx,
+        X_train,
+        X_test,
+        Y_train,
+        Y_test,
+    ):
+        self.label_encoder = label_encoder
+        self.preprocessor = preprocessor
+        self.train_idx = train_idx
+        self.test_idx = test_idx
+        self.X_train = X_train
+        self.X_test = X_test
+        self.Y_train = Y_train
+        self.Y_test = Y_test
+
+    @property
+    def n_features(self) -> int:
+        return self.X_train.shape[1]
+
+
+def build_feature_set(X, Y_raw, preprocessor) -> FeatureSet:
+    """
+    Codifica o alvo, faz o split estratificado 80/20 (random_state=42) e
+    ajusta o pré-processador no treino, transformando treino e teste.
+    """
+    le = LabelEncoder().fit(Y_raw)
+    Y = le.transform(Y_raw)
+    train_idx, test_idx = train_test_split(
+        np.arange(len(Y)), test_size=0.2, random_state=42, stratify=Y
+    )
+    X_train = preprocessor.fit_transform(X.iloc[train_idx])
+    X_test = preprocessor.transform(X.iloc[test_idx])
+    return FeatureSet(
+        le, preprocessor, train_idx, test_idx, X_train, X_test, Y[train_idx], Y[test_idx]
+    )
+
+
+def _features_dir(key: str) -> str:
+    return os.path.join(dataset_dir(key), FEATURES_DIRNAME)
+
+
+def _save_matrix(base_path: str, matrix):
+    if sp.issparse(matrix):
+        sp.save_npz(f"{base_path}.npz", sp.csr_matrix(matrix), compressed=False)
+    else:
+        np.save(f"{base_path}.npy", np.asarray(matrix, dtype=np.float64))
+
+
+def _load_matrix(base_path: str):
+    if os.path.exists(f"{base_path}.npz"):
+        return sp.load_npz(f"{base_path}.npz")
+    return np.load(f"{base_path}.npy", mmap_mode="r")
+
+
+def save_feature_set(key: str, features: FeatureSet):
+    target = _features_dir(key)
+    directory = tempfile.mkdtemp(
+        prefix=f"{FEATURES_DIRNAME}.", suffix=".tmp", dir=os.path.dirname(target)
+    )
+    stale = None
+    try:
+        _save_matrix(os.path.join(directory, "X_train"), features.X_train)
+        _save_matrix(os.path.join(directory, "X_test"), features.X_test)
+        np.savez(
+            os.path.join(directory, "split.npz"),
+            train_idx=features.train_idx,
+            test_idx=features.test_idx,
+            Y_train=features.Y_train,
+            Y_test=features.Y_test,
+        )
+        with open(os.path.join(directory, "meta.pkl"), "wb") as fh:
+            pickle.dump(
+                {
+                    "version": FORMAT_VERSION,
+                    "label_encoder": features.label_encoder,
+                    "preprocessor": features.preprocessor,
+                },
+                fh,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+
+        if os.path.isdir(target):
+            # Conjunto antigo, incompleto ou de outro formato: sai do caminho
+            # por rename (quem o tem aberto em memmap continua lendo).
+            stale = tempfile.mkdtemp(suffix=".old", dir=os.path.dirname(target))
+            try:
+                os.rename(target, os.path.join(stale, FEATURES_DIRNAME))
+            except OSError:
+                pass
+        try:
+            os.rename(directory, target)
+        except OSError:
+            # Outro processo publicou o seu conjunto entre os dois renames.
+            if not os.path.exists(os.path.join(target, "meta.pkl")):
+                raise
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+        if stale:
+            shutil.rmtree(stale, ignore_errors=True)
+
+
+def load_feature_set(key: str) -> FeatureSet | None:
+    directory = _features_dir(key)
+    meta_path = os.path.join(directory, "meta.pkl")
+    if not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path, "rb") as fh:
+            meta = pickle.load(fh)
+        if meta.get("version") != FORMAT_VERSION:
+            return None
+        split = np.load(os.path.join(directory, "split.npz"))
+        return FeatureSet(
+            meta["label_encoder"],
+            meta["preprocessor"],
+            split["train_idx"],
+            split["test_idx"],
+            _load_matrix(os.path.join(directory, "X_train")),
+            _load_matrix(os.path.join(directory, "X_test")),
+            split["Y_train"],
+            split["Y_test"],
+        )
+    except (IOError, ValueError, KeyError, pickle.UnpicklingError, EOFError) as e:
+        print(f"Erro ao carregar features salvas de {key}: {e}")
+        return None
+
+
+def get_feature_set(key: str | None, load_xy, make_preprocessor) -> FeatureSet:
+    """
+    Devolve o FeatureSet do dataset, da memória, do disco ou construindo-o
+    (e salvando) na primeira vez. Sem `key`, apenas constrói em memória.
+    `load_xy()` devolve `(X, Y_raw)` e só é chamado quando é preciso construir,
+    então os dados brutos não são carregados quando as features já existem.
+    """
+    if not key:
+        X, Y_raw = load_xy()
+        return build_feature_set(X, Y_raw, make_preprocessor(X))
+
+    with _lock:
+        features = _cache.get(key)
+        if features is not None:
+            _cache.move_to_end(key)
+            return features
+
+    features = load_feature_set(key)
+    if features is None:
+        X, Y_raw = load_xy()
+        features = build_feature_set(X, Y_raw, make_preprocessor(X))
+        try:
+            save_feature_set(key, features)
+        except (IOError, OSError) as e:
+            print(f"Erro ao salvar features de {key}: {e}")
+
+    with _lock:
+        _cache[key] = features
+        while len(_cache) > MEMORY_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return features
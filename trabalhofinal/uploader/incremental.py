@@ -0,0 +1,233 @@
+"""
+Re-análise incremental quando o usuário reenvia o mesmo CSV com linhas
+acrescentadas no fim (ou usa o upload em modo "acrescentar").
+
+O arquivo novo é reconhecido quando um upload anterior é prefixo exato
+dele. Nesse caso só as linhas novas são lidas e limpas
+(`lazy_dataset.append_column_cache`) e as estatísticas combináveis do
+dataset anterior (`DatasetStats`: sketches por coluna, acumuladores de
+correlação e contagens diárias) são atualizadas apenas com elas. Os
+gráficos cujos dados de entrada não mudaram são reaproveitados do relatório
+anterior pelo DataAnalyzer (`figure_cache`).
+"""
+
+import hashlib
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from .datasets import READ_BLOCK_SIZE, dataset_dir, uploads_index
+from .lazy_dataset import LazyDataset, append_column_cache
+from .sketches import merge_sketches, sketch_frame
+
+STATS_FILENAME = "estatisticas.pkl"
+FORMAT_VERSION = 2
+
+
+class CorrelationAccumulator:
+    """
+    Médias e co-momentos par a par que permitem calcular a correlação de
+    Pearson (com remoção de nulos por par, como `DataFrame.corr()`) e que
+    podem ser atualizados com novas linhas. Cada bloco é resumido em torno
+    do seu primeiro valor e combinado pelas fórmulas de Chan, como em
+    `sketches.Moments`: somas brutas perderiam toda a precisão em colunas
+    com deslocamento grande (timestamps, IDs, valores em centavos).
+    """
+
+    def __init__(self, columns):
+        k = len(columns)
+        self.columns = list(columns)
+        # Entrada [i, j]: linhas em que i e j estão presentes; `mean` e `m2`
+        # são da coluna i nessas linhas, `comoment` é simétrico. As médias
+        # ficam relativas a `reference` (o primeiro valor visto de cada
+        # coluna), para não guardar números grandes.
+        self.reference = np.full(k, np.nan)
+        self.n = np.zeros((k, k))
+        self.mean = np.zeros((k, k))
+        self.m2 = np.zeros((k, k))
+        self.comoment = np.zeros((k, k))
+
+    def _combine(self, n, mean, m2, comoment):
+        total = self.n + n
+        with np.errstate(divide="ignore", invalid="ignore"):
+            weight = np.where(total > 0, n / total, 0.0)
+        delta = mean - self.mean
+        self.mean += delta * weight
+        self.m2 += m2 + delta**2 * self.n * weight
+        self.comoment += comoment + delta * delta.T * self.n * weight
+        self.n = total
+
+    def add(self, df: pd.DataFrame):
+        values = df[self.columns].to_numpy(dtype=float, na_value=np.nan)
+        present = ~np.isnan(values)
+        if not present.any():
+            return
+        # Deslocamento pelo primeiro valor presente: uma coluna constante
+        # fica exatamente zero e continua com variância nula.
+        first = np.where(present.any(axis=0), present.argmax(axis=0), 0)
+        shift = values[first, np.arange(len(self.columns))]
+        self.reference = np.where(np.isnan(self.reference), shift, self.reference)
+        filled = np.where(present, values - shift, 0.0)
+        present = present.astype(float)
+
+        n = present.T @ present
+        sums = filled.T @ present
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = np.where(n > 0, sums / n, 0.0)
+        m2 = (filled**2).T @ present - sums * mean
+        comoment = filled.T @ filled - sums * mean.T
+        mean += np.nan_to_num(shift - self.reference)[:, None]
+        self._combine(n, mean, np.maximum(m2, 0.0), comoment)
+
+    def corr(self) -> pd.DataFrame:
+        varies = (self.n > 1) & (self.m2 > 0) & (self.m2.T > 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            corr = np.where(
+                varies, self.comoment / np.sqrt(self.m2 * self.m2.T), np.nan
+            )
+        np.fill_diagonal(corr, np.where(np.diag(varies), 1.0, np.nan))
+        return pd.DataFrame(
+            np.clip(corr, -1, 1), index=self.columns, columns=self.columns
+        )
+
+
+class DatasetStats:
+    """
+    Estatísticas combináveis de um dataset limpo. `parent_key` e
+    `appended_rows` indicam de qual dataset estas estatísticas vieram e
+    quantas linhas novas foram somadas a ele.
+    """
+
+    def __init__(self, numeric_columns, date_columns):
+        self.n_rows = 0
+        self.sketches = {}
+        self.correlation = CorrelationAccumulator(numeric_columns)
+        self.daily = {col: pd.Series(dtype="int64") for col in date_columns}
+        self.parent_key = None
+        self.appended_rows = 0
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "DatasetStats":
+        numeric = [
+            c
+            for c in df.columns
+            if pd.api.types.is_numeric_dtype(df[c])
+            and not pd.api.types.is_bool_dtype(df[c])
+        ]
+        dates = [c for c in df.columns if pd.api.types.is_datetime64_any_dtype(df[c])]
+        stats = cls(numeric, dates)
+        stats.add(df)
+        return stats
+
+    def add(self, df: pd.DataFrame):
+        if df.empty:
+            return
+        self.n_rows += len(df)
+        merge_sketches(self.sketches, sketch_frame(df))
+        self.correlation.add(df)
+        for col in self.daily:
+            days = df[col].dropna().dt.floor("D").value_counts()
+            self.daily[col] = self.daily[col].add(days, fill_value=0).astype("int64")
+
+    def daily_counts(self, col) -> pd.Series:
+        """Contagem de linhas por dia, em ordem cronológica (como `resample`)."""
+        return self.daily[col].sort_index()
+
+
+def stats_path(key: str) -> str:
+    return os.path.join(dataset_dir(key), STATS_FILENAME)
+
+
+def save_stats(key: str, stats: DatasetStats):
+    path = stats_path(key)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as fh:
+        pickle.dump(
+            {"version": FORMAT_VERSION, "stats": stats},
+            fh,
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+    os.replace(tmp_path, path)
+
+
+def load_stats(key: str) -> DatasetStats | None:
+    path = stats_path(key)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as fh:
+            data = pickle.load(fh)
+        if data.get("version") != FORMAT_VERSION:
+            return None
+        return data["stats"]
+    except (IOError, KeyError, pickle.UnpicklingError, EOFError) as e:
+        print(f"Erro ao carregar estatísticas salvas de {key}: {e}")
+        return None
+
+
+def _prefix_key(full_fs_path, n_bytes: int) -> str:
+    digest = hashlib.sha256()
+    remaining = n_bytes
+    with open(full_fs_path, "rb") as fh:
+        while remaining > 0:
+            block = fh.read(min(READ_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+    return digest.hexdigest()[:32]
+
+
+def find_base_upload(full_fs_path, scan: dict, media_root) -> dict | None:
+    """
+    Procura, entre os uploads ainda guardados, um arquivo que seja prefixo
+    exato do arquivo novo (terminando em fim de linha). Devolve
+    `{"key", "n_bytes"}` do upload encontrado ou None.
+    """
+    candidates = {}
+    for upload_path, key in uploads_index().items():
+        if key == scan["key"]:
+            continue
+        try:
+            n_bytes = os.path.getsize(os.path.join(media_root, upload_path))
+        except OSError:
+            continue
+        if 0 < n_bytes < scan["n_bytes"]:
+            candidates[(key, n_bytes)] = os.path.join(media_root, upload_path)
+
+    for (key, n_bytes), old_path in candidates.items():
+        with open(old_path, "rb") as fh:
+            fh.seek(n_bytes - 1)
+            if fh.read(1) != b"\n":
+                continue
+        if _prefix_key(full_fs_path, n_bytes) == key:
+            return {"key": key, "n_bytes": n_bytes}
+    return None
+
+
+def apply_append(base: dict, key: str, full_fs_path) -> bool:
+    """
+    Cria o cache colunar e as estatísticas do dataset `key` a partir do
+    dataset `base` (prefixo do arquivo) e só das linhas acrescentadas.
+    Devolve False se não for possível (o dataset é então processado do zero).
+    """
+    base_dataset = LazyDataset(base["key"])
+    try:
+        base_dataset.manifest
+    except FileNotFoundError:
+        return False
+
+    new_rows = append_column_cache(base_dataset, key, full_fs_path, base["n_bytes"])
+    if new_rows is None:
+        return False
+
+    stats = load_stats(base["key"])
+    if stats is None:
+        stats = DatasetStats.from_frame(base_dataset.load())
+    stats.add(new_rows)
+    stats.parent_key = base["key"]
+    stats.appended_rows = len(new_rows)
+    save_stats(key, stats)
+    return True
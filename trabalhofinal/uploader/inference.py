@@ -0,0 +1,300 @@
+"""
+Caminho rápido de inferência: na hora do treino, o pré-processamento
+(imputação, padronização e one-hot) é "compilado" num esquema de features
+simples; na predição, a entrada do formulário/JSON é validada e convertida
+direto numa linha NumPy, sem montar DataFrame nem rodar o ColumnTransformer,
+e o classificador é chamado uma única vez (`predict_proba` + argmax).
+"""
+
+import glob
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import threading
+
+import numpy as np
+
+from .analytics import clean_column_name
+from .datasets import dataset_dir
+
+MODELS_DIRNAME = "modelos"
+MODEL_NAMES = ("KNN", "DecisionTree", "RandomForest", "LogisticRegression", "SVM")
+
+_cache = {}
+_latest = {}
+_lock = threading.Lock()
+
+
+class FeatureSchema:
+    """
+    Descrição compilada das features: para cada coluna numérica, o valor de
+    imputação (mediana) e a média/escala do StandardScaler; para cada coluna
+    categórica, o valor de imputação (mais frequente) e o vocabulário
+    categoria -> posição no vetor one-hot.
+    """
+
+    def __init__(self, numeric: list, categorical: list, n_outputs: int, ignored=()):
+        self.numeric = numeric
+        self.categorical = categorical
+        self.n_outputs = n_outputs
+        self.columns = [f["name"] for f in numeric] + [f["name"] for f in categorical]
+        # Colunas de entrada sem efeito no modelo (descartadas pelo imputer).
+        self.ignored = list(ignored)
+
+    def unknown_columns(self, features: dict) -> list[str]:
+        """Nomes em `features` que não são colunas de entrada do modelo."""
+        known = set(self.columns) | set(getattr(self, "ignored", ()))
+        return [k for k in features if clean_column_name(k) not in known]
+
+    @classmethod
+    def from_preprocessor(cls, preprocessor) -> "FeatureSchema":
+        """
+        Compila o esquema a partir do ColumnTransformer já treinado
+        (transformadores "num" e "cat" de `_get_preprocessor`). Colunas
+        descartadas pelo SimpleImputer (só nulos no treino) não geram saída
+        no ColumnTransformer e ficam de fora do esquema.
+        """
+        numeric = []
+        categorical = []
+        ignored = []
+        offset = 0
+
+        num_pipeline = preprocessor.named_transformers_.get("num")
+        num_cols = list(_transformer_columns(preprocessor, "num"))
+        if num_cols:
+            imputer = num_pipeline.named_steps["imputer"]
+            scaler = num_pipeline.named_steps["scaler"]
+            # O scaler só vê as colunas mantidas pelo imputer; as estatísticas
+            # do imputer seguem as posições das colunas de entrada.
+            kept = _kept_columns(imputer, num_cols)
+            kept_names = {col for _, col in kept}
+            ignored += [col for col in num_cols if col not in kept_names]
+            for i, (position, col) in enumerate(kept):
+                numeric.append(
+                    {
+                        "name": col,
+                        "index": offset + i,
+                        "default": float(imputer.statistics_[position]),
+                        "mean": float(scaler.mean_[i]),
+                        "scale": float(scaler.scale_[i]),
+                    }
+                )
+            offset += len(scaler.mean_)
+
+        cat_pipeline = preprocessor.named_transformers_.get("cat")
+        cat_cols = list(_transformer_columns(preprocessor, "cat"))
+        if cat_cols:
+            imputer = cat_pipeline.named_steps["imputer"]
+            onehot = cat_pipeline.named_steps["onehot"]
+            kept = _kept_columns(imputer, cat_cols)
+            kept_names = {col for _, col in kept}
+            ignored += [col for col in cat_cols if col not in kept_names]
+            for i, (position, col) in enumerate(kept):
+                categories = onehot.categories_[i]
+                categorical.append(
+                    {
+                        "name": col,
+                        "default": str(imputer.statistics_[position]),
+                        "vocab": {
+                            str(value): offset + j for j, value in enumerate(categories)
+                        },
+                    }
+                )
+                offset += len(categories)
+
+        return cls(numeric, categorical, offset, ignored)
+
+    def transform(self, features: dict) -> np.ndarray:
+        """
+        Converte um dicionário coluna -> valor (strings vindas do formulário
+        ou valores JSON) numa linha (1, n_outputs). Colunas ausentes ou vazias
+        recebem o valor de imputação; categorias desconhecidas viram um
+        one-hot zerado, como no `handle_unknown="ignore"` do treino.
+        """
+        values = {clean_column_name(k): v for k, v in features.items()}
+        row = np.zeros((1, self.n_outputs))
+
+        for feature in self.numeric:
+            value = values.get(feature["name"])
+            if value is None or value == "":
+                number = feature["default"]
+            else:
+                try:
+                    number = float(value)
+                except (TypeError, ValueError):
+                    raise ValueError(
+                        f'Valor inválido para "{feature["name"]}": esperado número, recebido "{value}".'
+                    )
+                if np.isnan(number):
+                    number = feature["default"]
+            row[0, feature["index"]] = (number - feature["mean"]) / feature["scale"]
+
+        for feature in self.categorical:
+            value = values.get(feature["name"])
+            if value is None or value == "":
+                value = feature["default"]
+            index = feature["vocab"].get(str(value))
+            if index is not None:
+                row[0, index] = 1.0
+
+        return row
+
+
+def _kept_columns(imputer, columns) -> list[tuple[int, str]]:
+    """(posição na entrada, nome) das colunas que o imputer não descartou."""
+    kept = set(imputer.get_feature_names_out(list(columns)))
+    return [(i, col) for i, col in enumerate(columns) if col in kept]
+
+
+def _transformer_columns(preprocessor, name):
+    for transformer_name, _, columns in preprocessor.transformers_:
+        if transformer_name == name:
+            return columns
+    return []
+
+
+class CompiledModel:
+    """
+    Classificador treinado + esquema de features + rótulos originais.
+    """
+
+    def __init__(self, schema: FeatureSchema, classifier, classes, metrics: str):
+        self.schema = schema
+        self.classifier = classifier
+        self.classes = classes
+        self.metrics = metrics
+
+    @classmethod
+    def from_pipeline(cls, pipeline, label_encoder, metrics: str) -> "CompiledModel":
+        schema = FeatureSchema.from_preprocessor(pipeline.named_steps["preprocessor"])
+        return cls(
+            schema, pipeline.named_steps["classifier"], label_encoder.classes_, metrics
+        )
+
+    def predict(self, features: dict) -> dict:
+        return self.predict_row(self.schema.transform(features))
+
+    def predict_row(self, row: np.ndarray) -> dict:
+        proba = self.classifier.predict_proba(row)[0]
+        best = int(np.argmax(proba))
+        encoded = self.classifier.classes_
+        return {
+            "label": self.classes[encoded[best]],
+            "score": float(proba[best]),
+            "probabilities": {
+                str(self.classes[encoded[i]]): float(p) for i, p in enumerate(proba)
+            },
+        }
+
+
+def _normalized_hp(value) -> str:
+    """
+    Valor de hiperparâmetro como texto canônico: o formulário envia `"5"`,
+    a API JSON `5` ou `5.0`, e todos precisam identificar o mesmo modelo.
+    """
+    text = str(value).strip()
+    try:
+        number = float(text)
+    except ValueError:
+        return text
+    if number.is_integer():
+        return str(int(number))
+    return repr(number)
+
+
+def hps_id(hp_params: dict) -> str:
+    cleaned = {
+        k: _normalized_hp(v)
+        for k, v in sorted(hp_params.items())
+        if v not in ("", None)
+    }
+    return hashlib.sha1(json.dumps(cleaned).encode()).hexdigest()[:12]
+
+
+def _check_model_name(model_name: str):
+    # O nome entra no caminho do arquivo: só os modelos conhecidos passam.
+    if model_name not in MODEL_NAMES:
+        raise ValueError(f"Modelo desconhecido: {model_name!r}")
+
+
+def _model_path(dataset_key: str, model_name: str, hp_params: dict) -> str:
+    _check_model_name(model_name)
+    models_dir = os.path.join(dataset_dir(dataset_key), MODELS_DIRNAME)
+    os.makedirs(models_dir, exist_ok=True)
+    return os.path.join(models_dir, f"{model_name}-{hps_id(hp_params)}.pkl")
+
+
+def register_model(
+    dataset_key: str, model_name: str, hp_params: dict, compiled: CompiledModel
+):
+    """
+    Guarda o modelo compilado em memória e em disco (para outros workers).
+    """
+    path = _model_path(dataset_key, model_name, hp_params)
+    # Nome temporário exclusivo: dois treinos simultâneos do mesmo modelo
+    # não podem intercalar bytes no mesmo arquivo.
+    fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            pickle.dump(compiled, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    with _lock:
+        _cache[path] = (os.path.getmtime(path), compiled)
+        _latest[(dataset_key, model_name)] = path
+
+
+def get_model(
+    dataset_key: str, model_name: str, hp_params: dict | None = None
+) -> CompiledModel | None:
+    """
+    Busca um modelo compilado. Sem `hp_params`, devolve o treinado mais
+    recentemente para o dataset e modelo informados.
+    """
+    _check_model_name(model_name)
+    if hp_params is not None:
+        path = _model_path(dataset_key, model_name, hp_params)
+    else:
+        with _lock:
+            path = _latest.get((dataset_key, model_name))
+        if path is None:
+            pattern = os.path.join(
+                dataset_dir(dataset_key), MODELS_DIRNAME, f"{model_name}-*.pkl"
+            )
+            candidates = glob.glob(pattern)
+            if not candidates:
+                return None
+            path = max(candidates, key=os.path.getmtime)
+
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    with _lock:
+        cached = _cache.get(path)
+    # Um re-treino em outro worker sobrescreve o arquivo; o mtime invalida o cache.
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    try:
+        with open(path, "rb") as fh:
+            compiled = pickle.load(fh)
+    except (
+        IOError,
+        pickle.UnpicklingError,
+        EOFError,
+        AttributeError,
+        ImportError,
+        IndexError,
+        TypeError,
+        ValueError,
+    ) as e:
+        print(f"Erro ao carregar modelo salvo {path}: {e}")
+        return None
+    with _lock:
+        _cache[path] = (mtime, compiled)
+    return compiled
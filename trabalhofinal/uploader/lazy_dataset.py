@@ -0,0 +1,322 @@
+"""
+Cache colunar dos dados limpos de cada dataset e um "handle" preguiçoso
+sobre ele: o CSV é lido e limpo uma única vez, cada coluna é gravada em um
+arquivo próprio e, depois disso, views e o DataAnalyzer carregam apenas as
+colunas de que precisam.
+
+Colunas numéricas, booleanas e de data são gravadas como `.npy` e abertas
+com memmap: processos que usam o mesmo dataset (workers web, o pool de
+sketches, o comando em lote) compartilham as páginas do arquivo em vez de
+receber uma cópia serializada do DataFrame. As demais colunas usam pickle.
+
+A deduplicação (`dedup`) também fica no cache: a máscara das linhas lidas
+do CSV que foram mantidas, a impressão digital de cada linha mantida e, no
+manifesto, quantas duplicatas foram removidas.
+"""
+
+import datetime
+import json
+import os
+import shutil
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .analytics import clean_columns
+from .csv_reader import read_csv, read_csv_tail
+from .datasets import dataset_dir
+from .dedup import drop_duplicate_rows, row_fingerprints, unique_rows_mask
+from .sketches import merge_sketches, sketch_frame
+
+COLUMNS_DIRNAME = "colunas"
+MANIFEST_FILENAME = "manifest.json"
+ROW_MASK_FILENAME = "linhas_mantidas.npy"
+FINGERPRINTS_FILENAME = "impressoes.npy"
+
+_build_lock = threading.Lock()
+
+
+class LazyDataset:
+    """
+    Handle de um dataset limpo em cache. Criar o handle não lê nada;
+    `columns` e `n_rows` leem só o manifesto (construindo o cache a partir
+    do CSV na primeira vez) e `load(columns)` materializa apenas as colunas
+    pedidas, mantendo as já lidas em memória.
+    """
+
+    def __init__(
+        self,
+        key: str,
+        full_fs_path=None,
+        csv_format: dict | None = None,
+        directory=None,
+    ):
+        self.key = key
+        self.full_fs_path = full_fs_path
+        self.csv_format = csv_format
+        # `directory` permite abrir o cache sem o settings do Django
+        # (processos filhos iniciados com "spawn").
+        self.directory = directory or os.path.join(dataset_dir(key), COLUMNS_DIRNAME)
+        self._manifest = None
+        self._loaded = {}
+
+    @classmethod
+    def exists(cls, key: str) -> bool:
+        """Indica se o cache colunar do dataset já foi montado."""
+        return os.path.exists(
+            os.path.join(dataset_dir(key), COLUMNS_DIRNAME, MANIFEST_FILENAME)
+        )
+
+    @property
+    def manifest(self) -> dict:
+        if self._manifest is None:
+            manifest_path = os.path.join(self.directory, MANIFEST_FILENAME)
+            if not os.path.exists(manifest_path):
+                if self.full_fs_path is None:
+                    raise FileNotFoundError(
+                        f"Cache colunar do dataset {self.key} não encontrado."
+                    )
+                with _build_lock:
+                    if not os.path.exists(manifest_path):
+                        build_column_cache(self.key, self.full_fs_path, self.csv_format)
+            with open(manifest_path, encoding="utf-8") as fh:
+                self._manifest = json.load(fh)
+        return self._manifest
+
+    @property
+    def columns(self) -> list[str]:
+        return [c["name"] for c in self.manifest["columns"]]
+
+    @property
+    def n_rows(self) -> int:
+        return self.manifest["n_rows"]
+
+    @property
+    def csv_info(self) -> dict:
+        return self.manifest.get("csv_info", {})
+
+    @property
+    def duplicates_removed(self) -> int:
+        return self.manifest.get("duplicates_removed", 0)
+
+    def row_mask(self) -> np.ndarray | None:
+        """
+        Máscara, sobre as linhas lidas do CSV, das que ficaram no dataset
+        depois da deduplicação (None em caches antigos, sem a máscara).
+        """
+        path = os.path.join(self.directory, ROW_MASK_FILENAME)
+        if not os.path.exists(path):
+            return None
+        return np.load(path, mmap_mode="r")
+
+    def row_fingerprints(self) -> np.ndarray:
+        """Impressão digital de cada linha do dataset, na ordem das linhas."""
+        path = os.path.join(self.directory, FINGERPRINTS_FILENAME)
+        if os.path.exists(path):
+            return np.load(path, mmap_mode="r")
+        return row_fingerprints(self.load())
+
+    def _column_path(self, name: str) -> str:
+        for column in self.manifest["columns"]:
+            if column["name"] == name:
+                return os.path.join(self.directory, column["file"])
+        raise KeyError(f'Coluna "{name}" não existe no dataset.')
+
+    def column(self, name: str) -> pd.Series:
+        if name not in self._loaded:
+            path = self._column_path(name)
+            if path.endswith(".npy"):
+                values = np.load(path, mmap_mode="r")
+                self._loaded[name] = pd.Series(values, name=name, copy=False)
+            else:
+                self._loaded[name] = pd.read_pickle(path)
+        return self._loaded[name]
+
+    def load(self, columns=None, start=None, stop=None) -> pd.DataFrame:
+        """
+        DataFrame apenas com `columns` (todas, se None), na ordem original,
+        opcionalmente só com as linhas `start:stop`. Colunas em memmap não
+        são copiadas.
+        """
+        if columns is None:
+            columns = self.columns
+        else:
+            wanted = set(columns)
+            columns = [c for c in self.columns if c in wanted]
+        df = pd.DataFrame({name: self.column(name) for name in columns}, copy=False)
+        if start is not None or stop is not None:
+            df = df.iloc[start:stop]
+        return df
+
+    def sketch(self, columns=None, chunk_rows: int = 100_000, workers: int = 1):
+        """
+        Sketches das `columns` por blocos de `chunk_rows` linhas. Com
+        `workers > 1`, cada processo recebe só o diretório do cache e o
+        intervalo de linhas e abre as colunas por conta própria.
+        """
+        columns = self.columns if columns is None else list(columns)
+        bounds = [
+            (start, min(start + chunk_rows, self.n_rows))
+            for start in range(0, self.n_rows, chunk_rows)
+        ]
+        result = {}
+        if workers <= 1:
+            for start, stop in bounds:
+                merge_sketches(
+                    result, sketch_frame(self.load(columns, start, stop), columns)
+                )
+            return result
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    _sketch_slice, self.key, self.directory, columns, start, stop
+                )
+                for start, stop in bounds
+            ]
+            for future in futures:
+                merge_sketches(result, future.result())
+        return result
+
+
+def _sketch_slice(key, directory, columns, start, stop) -> dict:
+    dataset = LazyDataset(key, directory=directory)
+    return sketch_frame(dataset.load(columns, start, stop), columns)
+
+
+def _is_memmappable(series: pd.Series) -> bool:
+    return isinstance(series.dtype, np.dtype) and series.dtype.kind in "biufmM"
+
+
+def build_column_cache(key: str, full_fs_path, csv_format: dict | None = None):
+    df, csv_info = read_csv(full_fs_path, fmt=csv_format)
+    df, dedup = drop_duplicate_rows(clean_columns(df))
+    write_column_cache(key, df, csv_info, dedup)
+
+
+def write_column_cache(
+    key: str, df: pd.DataFrame, csv_info: dict, dedup: dict | None = None
+):
+    """
+    Grava as colunas de `df` e o manifesto. `dedup` é o resultado de
+    `dedup.drop_duplicate_rows` (máscara, impressões e duplicatas removidas).
+
+    Tudo é gravado num diretório temporário próprio e depois renomeado para
+    o lugar: outro processo (worker web, comando em lote) que monte o mesmo
+    cache ao mesmo tempo nunca sobrescreve arquivos `.npy` que alguém já
+    abriu em memmap. Se o cache já existir, o recém-montado é descartado.
+    """
+    target = os.path.join(dataset_dir(key), COLUMNS_DIRNAME)
+    directory = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    os.makedirs(directory)
+
+    try:
+        columns = []
+        for i, name in enumerate(df.columns):
+            if _is_memmappable(df[name]):
+                filename = f"col_{i:05d}.npy"
+                np.save(os.path.join(directory, filename), df[name].to_numpy())
+            else:
+                filename = f"col_{i:05d}.pkl"
+                df[name].to_pickle(os.path.join(directory, filename))
+            columns.append(
+                {"name": name, "file": filename, "dtype": str(df[name].dtype)}
+            )
+
+        manifest = {"n_rows": len(df), "columns": columns, "csv_info": csv_info}
+        if dedup is not None:
+            if dedup.get("mask") is not None:
+                np.save(os.path.join(directory, ROW_MASK_FILENAME), dedup["mask"])
+            np.save(
+                os.path.join(directory, FINGERPRINTS_FILENAME), dedup["fingerprints"]
+            )
+            manifest["duplicates_removed"] = dedup["removed"]
+        with open(
+            os.path.join(directory, MANIFEST_FILENAME), "w", encoding="utf-8"
+        ) as fh:
+            json.dump(manifest, fh, ensure_ascii=False, default=str)
+
+        if os.path.isdir(target) and not os.path.exists(
+            os.path.join(target, MANIFEST_FILENAME)
+        ):
+            # Sobra de um cache incompleto (ex: gravado por versões antigas).
+            shutil.rmtree(target, ignore_errors=True)
+        try:
+            os.rename(directory, target)
+        except OSError:
+            # Outro processo terminou antes: o cache dele já está em uso.
+            if not os.path.exists(os.path.join(target, MANIFEST_FILENAME)):
+                raise
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _cast_like(values: pd.Series, like: pd.Series) -> pd.Series:
+    """
+    Converte as linhas novas para o tipo que a coluna `like` já tem no cache,
+    recusando conversões que perderiam informação (ex: 3.5 -> 3).
+    """
+    dtype = like.dtype
+    if dtype == object:
+        # O pyarrow lê "2024-01-31" como datetime.date (coluna 'object'); o
+        # motor C das linhas novas deixa texto, que nunca seria igual à data.
+        first = like.first_valid_index()
+        if first is not None and type(like[first]) is datetime.date:
+            dates = pd.to_datetime(values, format="%Y-%m-%d", errors="raise")
+            return dates.dt.date.astype(object).where(values.notna(), None)
+    if values.dtype == dtype:
+        return values
+    cast = values.astype(dtype)
+    if pd.api.types.is_numeric_dtype(values.dtype) and not np.array_equal(
+        cast.to_numpy(dtype=float, na_value=np.nan),
+        values.to_numpy(dtype=float, na_value=np.nan),
+        equal_nan=True,
+    ):
+        raise ValueError(f'Valores novos de "{values.name}" mudam o tipo da coluna.')
+    return cast
+
+
+def append_column_cache(
+    base: "LazyDataset", key: str, full_fs_path, offset: int
+) -> pd.DataFrame | None:
+    """
+    Monta o cache colunar do dataset `key`, cujo arquivo é o de `base` com
+    linhas acrescentadas a partir do byte `offset`: só essas linhas são lidas
+    e limpas, e as que repetem linhas já existentes são descartadas, como na
+    limpeza completa. Devolve as linhas realmente novas, ou None se elas não
+    couberem nos tipos das colunas existentes (aí o cache é montado do zero).
+    """
+    # O formato (e o motor) registrados na leitura do arquivo base garantem
+    # que as linhas novas sejam interpretadas exatamente da mesma forma.
+    new_rows, skipped = read_csv_tail(full_fs_path, offset, base.columns, base.csv_info)
+    new_rows = clean_columns(new_rows)
+    old = base.load()
+    try:
+        for name in old.columns:
+            new_rows[name] = _cast_like(new_rows[name], old[name])
+    except (ValueError, TypeError) as e:
+        print(f"Acréscimo incompatível com o dataset {base.key}: {e}")
+        return None
+
+    # As linhas antigas já são únicas: só as impressões guardadas delas
+    # entram na comparação, e apenas linhas de impressão repetida são lidas.
+    combined = pd.concat([old, new_rows], ignore_index=True)
+    fingerprints = np.concatenate([base.row_fingerprints(), row_fingerprints(new_rows)])
+    keep = unique_rows_mask(combined, fingerprints)
+    new_keep = keep[len(old) :]
+    new_rows = new_rows[new_keep].reset_index(drop=True)
+    combined = combined[keep].reset_index(drop=True)
+
+    base_mask = base.row_mask()
+    dedup = {
+        "mask": None if base_mask is None else np.concatenate([base_mask, new_keep]),
+        "fingerprints": fingerprints[keep],
+        "removed": base.duplicates_removed + int(len(new_keep) - new_keep.sum()),
+    }
+    csv_info = dict(
+        base.csv_info, skipped_lines=base.csv_info.get("skipped_lines", 0) + skipped
+    )
+    write_column_cache(key, combined, csv_info, dedup)
+    return new_rows
@@ -0,0 +1,342 @@
+import glob
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.template.loader import render_to_string
+
+from uploader.analytics import DataAnalyzer, profile_stream
+from uploader.csv_reader import iter_csv
+from uploader.datasets import (
+    TIER_LARGE,
+    TIER_MEDIUM,
+    TIER_SMALL,
+    classify_tier,
+    dataset_dir,
+    get_analyzer_options,
+    scan_file,
+)
+from uploader.inference import MODEL_NAMES
+from uploader.lazy_dataset import LazyDataset
+from uploader.ml_models import run_ml_task
+from uploader.reports import collect_plots, group_plots, save_report
+
+SUMMARY_FILENAME = "summary.json"
+REPORT_HTML_FILENAME = "report.html"
+LOCK_FILENAME = "batch.lock"
+# Lock sem PID legível (processo morto logo após criá-lo) mais velho que
+# isto é considerado abandonado.
+LOCK_STALE_SECONDS = 60
+
+
+def _init_worker():
+    # Com o método "spawn" (macOS/Windows) o processo filho começa do zero.
+    django.setup()
+
+
+def _expand_paths(patterns) -> list[str]:
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = glob.glob(os.path.join(pattern, "**", "*.csv"), recursive=True)
+        else:
+            matches = glob.glob(pattern, recursive=True)
+        paths.extend(m for m in matches if os.path.isfile(m))
+    return sorted(set(os.path.abspath(p) for p in paths))
+
+
+def _pid_alive(pid: int) -> bool:
+    if os.name == "nt":
+        # No Windows, os.kill encerraria o processo: vale só a idade do lock.
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _lock_is_stale(lock_path: str) -> bool:
+    """
+    Lock deixado por uma execução que caiu: o PID gravado nele não existe
+    mais (ou, sem PID, o arquivo já é velho).
+    """
+    try:
+        with open(lock_path, encoding="utf-8") as fh:
+            pid = int(fh.read().strip() or 0)
+        age = time.time() - os.path.getmtime(lock_path)
+    except FileNotFoundError:
+        return True
+    except (OSError, ValueError):
+        pid, age = 0, LOCK_STALE_SECONDS + 1
+    if pid > 0:
+        return not _pid_alive(pid)
+    return age > LOCK_STALE_SECONDS
+
+
+def _acquire_lock(lock_path: str) -> bool:
+    for _ in range(2):
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if not _lock_is_stale(lock_path):
+                return False
+            try:
+                os.remove(lock_path)
+            except FileNotFoundError:
+                pass
+            continue
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            fh.write(str(os.getpid()))
+        return True
+    return False
+
+
+def process_csv(path: str, models: list[str], force: bool, full: bool = False) -> dict:
+    """
+    Analisa um CSV (e opcionalmente treina modelos), gravando nos mesmos
+    caches usados pela aplicação web: relatório JSON, pacote HTML estático,
+    feature store e modelos compilados. Arquivos cujo hash de conteúdo já foi
+    processado com sucesso são pulados (com `full`, só se a análise anterior
+    também foi completa).
+
+    Como na aplicação web, arquivos médios são analisados sobre uma amostra
+    e os grandes recebem só o perfil em streaming (sem modelos), a menos que
+    `full` seja verdadeiro.
+    """
+    scan = scan_file(path)
+    key = scan["key"]
+    directory = dataset_dir(key)
+    summary_path = os.path.join(directory, SUMMARY_FILENAME)
+
+    if not force and os.path.exists(summary_path):
+        with open(summary_path, encoding="utf-8") as fh:
+            summary = json.load(fh)
+        if summary.get("status") == "ok" and (summary.get("full") or not full):
+            summary["status"] = "pulado"
+            return summary
+
+    # Dois arquivos com o mesmo conteúdo no mesmo lote: só um processa. O
+    # lock guarda o PID, então o de uma execução que caiu não bloqueia as
+    # seguintes.
+    lock_path = os.path.join(directory, LOCK_FILENAME)
+    if not _acquire_lock(lock_path):
+        return {"file": path, "dataset": key, "status": "pulado"}
+
+    try:
+        return _process_locked(path, scan, summary_path, models, full)
+    finally:
+        os.remove(lock_path)
+
+
+def _profile_only(path: str, key: str) -> dict:
+    """Perfil em streaming de um arquivo grande, como na página de análise."""
+    chunks = iter_csv(
+        path, chunksize=getattr(settings, "ANALYSIS_STREAM_CHUNK_ROWS", 100_000)
+    )
+    grouped_plots = group_plots(
+        profile_stream(chunks, workers=getattr(settings, "ANALYSIS_SKETCH_WORKERS", 1))
+    )
+    save_report(key, grouped_plots, variant="perfil")
+    return grouped_plots
+
+
+def _write_html(directory: str, grouped_plots: dict):
+    html = render_to_string("uploader/analysis.html", {"grouped_plots": grouped_plots})
+    with open(
+        os.path.join(directory, REPORT_HTML_FILENAME), "w", encoding="utf-8"
+    ) as fh:
+        fh.write(html)
+
+
+def _process_locked(
+    path: str, scan: dict, summary_path: str, models: list[str], full: bool
+) -> dict:
+    start = time.perf_counter()
+    key = scan["key"]
+    directory = os.path.dirname(summary_path)
+    tier = classify_tier(scan["n_rows"], scan["n_bytes"])
+    summary = {
+        "file": path,
+        "dataset": key,
+        "rows": scan["n_rows"],
+        "bytes": scan["n_bytes"],
+        "tier": tier,
+        # Arquivos pequenos sempre recebem a análise completa.
+        "full": full or tier == TIER_SMALL,
+    }
+
+    try:
+        if tier == TIER_LARGE and not full:
+            grouped_plots = _profile_only(path, key)
+            _write_html(directory, grouped_plots)
+            summary["plots"] = sum(len(p) for p in grouped_plots.values())
+            if models:
+                summary["models"] = "pulados: arquivo grande (use --full)"
+            summary["status"] = "ok"
+            return _write_summary(summary, summary_path, start)
+
+        sample_size = None
+        if tier == TIER_MEDIUM and not full:
+            sample_size = getattr(settings, "ANALYSIS_SAMPLE_ROWS", 20_000)
+            summary["sample_rows"] = sample_size
+
+        dataset = LazyDataset(key, path)
+        summary["csv"] = dataset.csv_info
+        summary["duplicates_removed"] = dataset.duplicates_removed
+        analyzer = DataAnalyzer.from_dataset(
+            dataset, sample_size=sample_size, **get_analyzer_options()
+        )
+        grouped_plots = group_plots(collect_plots(analyzer))
+        save_report(key, grouped_plots)
+        _write_html(directory, grouped_plots)
+
+        summary.update(
+            {
+                "columns": list(analyzer.df.columns),
+                "numeric_cols": analyzer.numeric_cols,
+                "categorical_cols": analyzer.categorical_cols,
+                "date_cols": analyzer.date_cols,
+                "geo_cols": analyzer.geo_cols,
+                "plots": sum(len(p) for p in grouped_plots.values()),
+            }
+        )
+
+        summary["models"] = {}
+        for model_name in models:
+            result = run_ml_task(
+                dataset, model_name, {}, {}, "retrain", dataset_key=key
+            )
+            summary["models"][model_name] = result
+
+        summary["status"] = "ok"
+    except Exception as e:
+        summary["status"] = "erro"
+        summary["error"] = str(e)
+
+    return _write_summary(summary, summary_path, start)
+
+
+def _write_summary(summary: dict, summary_path: str, start: float) -> dict:
+    summary["seconds"] = round(time.perf_counter() - start, 3)
+    tmp_path = f"{summary_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(summary, fh, ensure_ascii=False, indent=2, default=str)
+    os.replace(tmp_path, summary_path)
+    return summary
+
+
+class Command(BaseCommand):
+    help = (
+        "Analisa em lote os CSVs de diretórios/globs, em paralelo, gravando "
+        "relatórios e resumos JSON nos caches usados pela aplicação web."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "paths", nargs="+", help="Diretórios ou padrões glob com arquivos .csv"
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Processos em paralelo",
+        )
+        parser.add_argument(
+            "--model",
+            action="append",
+            default=[],
+            dest="models",
+            choices=MODEL_NAMES,
+            help="Treina também este modelo (pode ser repetido)",
+        )
+        parser.add_argument(
+            "--output",
+            help="Copia report.html e summary.json de cada arquivo para este diretório",
+        )
+        parser.add_argument(
+            "--force", action="store_true", help="Reprocessa arquivos já analisados"
+        )
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help=(
+                "Análise completa de todos os arquivos: sem amostragem nos médios"
+                " e com relatório e modelos também nos grandes"
+            ),
+        )
+
+    def handle(self, *args, **options):
+        paths = _expand_paths(options["paths"])
+        if not paths:
+            raise CommandError("Nenhum arquivo .csv encontrado.")
+
+        self.stdout.write(f"{len(paths)} arquivo(s) para processar.")
+        counts = {"ok": 0, "pulado": 0, "erro": 0}
+        bundles = []
+
+        with ProcessPoolExecutor(
+            max_workers=max(options["workers"], 1), initializer=_init_worker
+        ) as executor:
+            futures = {
+                executor.submit(
+                    process_csv,
+                    path,
+                    options["models"],
+                    options["force"],
+                    options["full"],
+                ): path
+                for path in paths
+            }
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    summary = future.result()
+                except Exception as e:
+                    summary = {"status": "erro", "error": str(e)}
+
+                status = summary.get("status", "erro")
+                counts[status] = counts.get(status, 0) + 1
+                message = f"[{status}] {path}"
+                if status == "erro":
+                    message += f": {summary.get('error')}"
+                    self.stderr.write(message)
+                else:
+                    self.stdout.write(message)
+
+                if options["output"] and summary.get("dataset"):
+                    bundles.append((path, summary["dataset"]))
+
+        # Só depois de todos terminarem: um arquivo pulado por ter o mesmo
+        # conteúdo de outro ainda em processamento recebe o pacote dele.
+        for path, key in bundles:
+            self._copy_bundle(path, key, options["output"])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Concluído: {counts['ok']} processado(s), {counts['pulado']} pulado(s),"
+                f" {counts['erro']} com erro."
+            )
+        )
+
+    def _copy_bundle(self, path, key, output_dir):
+        stem = os.path.splitext(os.path.basename(path))[0]
+        target = os.path.join(output_dir, f"{stem}-{key[:8]}")
+        source = dataset_dir(key)
+        files = [
+            os.path.join(source, filename)
+            for filename in (REPORT_HTML_FILENAME, SUMMARY_FILENAME)
+            if os.path.exists(os.path.join(source, filename))
+        ]
+        if not files:
+            return
+        os.makedirs(target, exist_ok=True)
+        for file in files:
+            shutil.copy2(file, target)
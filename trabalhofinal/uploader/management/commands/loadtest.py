@@ -0,0 +1,555 @@
+import functools
+import html
+import http.cookiejar
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from uploader.inference import MODEL_NAMES
+
+# Ação simulada -> nome da URL em uploader/urls.py.
+ENDPOINTS = {
+    "upload": "upload",
+    "analysis": "analysis",
+    "prediction": "prediction",
+    "api": "prediction_api",
+}
+DEFAULT_MIX = "upload=1,analysis=4,prediction=3,api=2"
+
+# As views mostram erros na própria página (status 200): estes trechos
+# indicam que a requisição falhou do ponto de vista do usuário (o grupo, se
+# houver, é a mensagem).
+ERROR_MARKERS = {
+    "upload": re.compile(r"Erro ao processar o arquivo[^<]*|Envie um arquivo[^<]*"),
+    "analysis": re.compile(r'Erro na Análise</h2>\s*<p class="muted">([^<]*)'),
+    "prediction": re.compile(
+        r"(?:Erro (?:ao|na|inesperado)|Sessão expirada|Modelo não selecionado)[^<]*"
+    ),
+}
+EXPECTED_STATUS = {"upload": 302}
+
+FEATURES = {
+    "idade": "35",
+    "genero": "Drama",
+    "orcamento": "1000000",
+    "data": "2020-01-01 00:00:00",
+}
+
+
+def make_csv(n_rows: int, seed: int) -> bytes:
+    """
+    CSV sintético no formato dos datasets de filmes do projeto, com a coluna
+    alvo (`sucesso`) por último.
+    """
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(
+        {
+            "Idade": rng.integers(18, 80, n_rows),
+            "Genero": rng.choice(["Ação", "Drama", "Comédia", "Terror"], n_rows),
+            "Orcamento": rng.normal(1e7, 3e6, n_rows).round(2),
+            "Data": pd.date_range("2020-01-01", periods=n_rows, freq="h").astype(str),
+            "Sucesso": rng.choice(["sim", "nao"], n_rows),
+        }
+    )
+    return df.to_csv(index=False).encode("utf-8")
+
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise CommandError(
+                f'Ação "{name}" desconhecida no --mix (use {", ".join(ENDPOINTS)}).'
+            )
+        try:
+            mix[name] = float(weight or 1)
+        except ValueError:
+            raise CommandError(f'Peso inválido no --mix: "{part}".')
+    if not any(w > 0 for w in mix.values()):
+        raise CommandError("O --mix precisa de ao menos um peso positivo.")
+    return mix
+
+
+def _rss_bytes(pid: int) -> int | None:
+    """Memória residente atual do processo (Linux), ou None se indisponível."""
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    if pid == os.getpid():
+        try:
+            import resource
+
+            # Sem /proc, só o pico está disponível (KB no Linux, bytes no macOS).
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if peak > 1 << 32 else peak * 1024
+        except ImportError:
+            pass
+    return None
+
+
+class MemorySampler:
+    """Amostra periodicamente a memória residente dos processos `pids`."""
+
+    def __init__(self, pids, interval: float = 0.2):
+        self.pids = list(pids)
+        self.interval = interval
+        self.samples = {pid: [] for pid in self.pids}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._sample()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+    def _sample(self):
+        for pid in self.pids:
+            rss = _rss_bytes(pid)
+            if rss is not None:
+                self.samples[pid].append(rss)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def summary(self) -> dict:
+        mb = 1024 * 1024
+        return {
+            pid: {
+                "inicio_mb": round(values[0] / mb, 1),
+                "pico_mb": round(max(values) / mb, 1),
+                "fim_mb": round(values[-1] / mb, 1),
+            }
+            for pid, values in self.samples.items()
+            if values
+        }
+
+
+class InProcessTransport:
+    """Requisições direto no handler do Django, sem servidor (test Client)."""
+
+    def __init__(self):
+        self.client = Client(HTTP_HOST="localhost")
+
+    def get(self, path):
+        response = self.client.get(path)
+        return response.status_code, response.content
+
+    def post(self, path, data):
+        response = self.client.post(path, data)
+        return response.status_code, response.content
+
+    def upload(self, path, filename, content):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        return self.post(
+            path,
+            {"csv_file": SimpleUploadedFile(filename, content, "text/csv")},
+        )
+
+    def post_json(self, path, payload):
+        response = self.client.post(
+            path, json.dumps(payload), content_type="application/json"
+        )
+        return response.status_code, response.content
+
+    def close(self):
+        connections.close_all()
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpTransport:
+    """
+    Requisições HTTP para um servidor já rodando (runserver, gunicorn...),
+    com cookies de sessão e token CSRF próprios de cada usuário simulado.
+    """
+
+    def __init__(self, base_url: str, timeout: float):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies), _NoRedirect
+        )
+
+    def _open(self, path, body=None, headers=None):
+        request = urllib.request.Request(
+            self.base_url + path, data=body, headers=headers or {}
+        )
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def _csrf_headers(self):
+        token = next((c.value for c in self.cookies if c.name == "csrftoken"), None)
+        if token is None:
+            # A página de upload emite o cookie CSRF (não entra na medição).
+            self._open(reverse("upload"))
+            token = next((c.value for c in self.cookies if c.name == "csrftoken"), "")
+        return {"X-CSRFToken": token, "Referer": self.base_url + "/"}
+
+    def get(self, path):
+        return self._open(path)
+
+    def post(self, path, data):
+        body = urllib.parse.urlencode(data).encode("utf-8")
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        return self._open(path, body, {**self._csrf_headers(), **headers})
+
+    def upload(self, path, filename, content):
+        boundary = uuid.uuid4().hex
+        body = b"".join(
+            [
+                f"--{boundary}\r\n".encode(),
+                b'Content-Disposition: form-data; name="csv_file"; ',
+                f'filename="{filename}"\r\n'.encode(),
+                b"Content-Type: text/csv\r\n\r\n",
+                content,
+                f"\r\n--{boundary}--\r\n".encode(),
+            ]
+        )
+        headers = {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+        return self._open(path, body, {**self._csrf_headers(), **headers})
+
+    def post_json(self, path, payload):
+        headers = {"Content-Type": "application/json"}
+        return self._open(path, json.dumps(payload).encode("utf-8"), headers)
+
+    def close(self):
+        pass
+
+
+class VirtualUser:
+    """
+    Um usuário simulado: faz o upload do seu CSV e depois sorteia as ações
+    segundo os pesos do mix. Predições pela API só acontecem depois de uma
+    predição pela página (que treina o modelo, se preciso).
+    """
+
+    def __init__(self, transport, csv_bytes, n_rows, mix, model, seed):
+        self.transport = transport
+        self.csv_bytes = csv_bytes
+        self.n_rows = n_rows
+        self.mix = mix
+        self.model = model
+        self.rng = random.Random(seed)
+        self.uploaded = False
+        self.trained = False
+
+    def next_action(self) -> str:
+        if not self.uploaded:
+            return "upload"
+        action = self.rng.choices(list(self.mix), weights=list(self.mix.values()))[0]
+        if action == "api" and not self.trained:
+            return "prediction"
+        return action
+
+    def run(self, action: str):
+        path = reverse(ENDPOINTS[action])
+        if action == "upload":
+            result = self.transport.upload(
+                path, f"carga_{self.n_rows}.csv", self.csv_bytes
+            )
+        elif action == "analysis":
+            result = self.transport.get(path)
+        elif action == "prediction":
+            data = {"action": "predict", "modelo": self.model}
+            data.update({f"X_{k}": v for k, v in FEATURES.items()})
+            result = self.transport.post(path, data)
+        else:
+            result = self.transport.post_json(
+                path, {"modelo": self.model, "features": FEATURES}
+            )
+        return result
+
+    def step(self) -> tuple[str, float, str | None]:
+        action = self.next_action()
+        start = time.perf_counter()
+        try:
+            status, body = self.run(action)
+            error = _check_response(action, status, body)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        seconds = time.perf_counter() - start
+        if error is None:
+            if action == "upload":
+                self.uploaded = True
+            elif action == "prediction":
+                self.trained = True
+        return action, seconds, error
+
+
+def _check_response(action: str, status: int, body: bytes) -> str | None:
+    marker = ERROR_MARKERS.get(action)
+    if marker is not None:
+        match = marker.search(body.decode("utf-8", errors="replace"))
+        if match:
+            return html.unescape(match.group(match.lastindex or 0)).strip()
+    if status != EXPECTED_STATUS.get(action, 200):
+        return f"HTTP {status}"
+    return None
+
+
+def summarize(records, wall_seconds: float) -> dict:
+    by_action = defaultdict(list)
+    for record in records:
+        by_action[record[0]].append(record)
+
+    def stats(items):
+        latencies = np.array([seconds for _, seconds, _ in items]) * 1000
+        errors = [error for _, _, error in items if error]
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        return {
+            "requisicoes": len(items),
+            "erros": len(errors),
+            "p50_ms": round(float(p50), 1),
+            "p95_ms": round(float(p95), 1),
+            "p99_ms": round(float(p99), 1),
+            "media_ms": round(float(latencies.mean()), 1),
+            "req_por_s": round(len(items) / wall_seconds, 2),
+            "exemplos_de_erro": sorted(set(errors))[:3],
+        }
+
+    result = {action: stats(items) for action, items in sorted(by_action.items())}
+    if records:
+        result["total"] = stats(records)
+    return result
+
+
+class Command(BaseCommand):
+    help = (
+        "Teste de carga: usuários simultâneos fazendo upload, análise e "
+        "predição, dentro do processo (test Client) ou contra um servidor "
+        "local. Mostra latência p50/p95/p99, vazão, memória e erros por "
+        "endpoint. O servidor só mantém UPLOADS_MAX_FILES uploads (padrão 3) "
+        "e apaga os mais antigos: com --url e mais usuários que isso, o "
+        "upload de um apaga o arquivo de outro e as requisições seguintes "
+        "dele falham; aumente o limite no servidor testado. No próprio "
+        "processo o limite é desligado."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url",
+            help="Servidor alvo (ex: http://127.0.0.1:8000). Sem ele, roda no próprio processo",
+        )
+        parser.add_argument("--users", type=int, default=4, help="Usuários simultâneos")
+        parser.add_argument(
+            "--duration", type=float, default=30, help="Duração do teste em segundos"
+        )
+        parser.add_argument(
+            "--requests",
+            type=int,
+            help="Número de requisições por usuário (em vez de --duration)",
+        )
+        parser.add_argument(
+            "--mix",
+            default=DEFAULT_MIX,
+            help=f"Pesos das ações de cada usuário (padrão: {DEFAULT_MIX})",
+        )
+        parser.add_argument(
+            "--rows",
+            type=int,
+            action="append",
+            help="Linhas do CSV de cada usuário; repetindo, os tamanhos são "
+            "distribuídos entre os usuários (padrão: 1000 e 10000)",
+        )
+        parser.add_argument(
+            "--unique-data",
+            action="store_true",
+            help="Um CSV diferente por usuário (sem compartilhar caches entre eles)",
+        )
+        parser.add_argument("--model", default="DecisionTree", choices=MODEL_NAMES)
+        parser.add_argument(
+            "--think",
+            type=float,
+            default=0,
+            help="Pausa média entre as requisições de um usuário, em segundos",
+        )
+        parser.add_argument(
+            "--server-pid",
+            type=int,
+            action="append",
+            default=[],
+            dest="server_pids",
+            help="PID de um worker do servidor para medir a memória (com --url; pode ser repetido)",
+        )
+        parser.add_argument(
+            "--media-root",
+            help="MEDIA_ROOT do teste no processo (padrão: diretório temporário, "
+            "apagado no fim; use um diretório fixo para medir com caches quentes)",
+        )
+        parser.add_argument(
+            "--timeout", type=float, default=300, help="Timeout HTTP em segundos"
+        )
+        parser.add_argument("--json", help="Grava o resultado neste arquivo JSON")
+
+    def handle(self, *args, **options):
+        if options["users"] < 1:
+            raise CommandError("--users deve ser pelo menos 1.")
+        mix = parse_mix(options["mix"])
+        sizes = options["rows"] or [1000, 10000]
+
+        if options["url"]:
+            make_transport = functools.partial(
+                HttpTransport, options["url"], options["timeout"]
+            )
+            result = self._run(
+                make_transport, mix, sizes, options["server_pids"], options
+            )
+            self._report(result, options["json"])
+            return
+
+        media_root = options["media_root"] or tempfile.mkdtemp(prefix="carga_")
+        # Sessões em cache local: o teste não escreve no banco da aplicação.
+        # Sem limite de uploads: os reenvios de um usuário não podem apagar
+        # o arquivo que outro ainda está usando (seria erro do teste, não
+        # da carga).
+        overrides = override_settings(
+            MEDIA_ROOT=media_root,
+            SESSION_ENGINE="django.contrib.sessions.backends.cache",
+            UPLOADS_MAX_FILES=None,
+        )
+        try:
+            with overrides:
+                result = self._run(
+                    InProcessTransport, mix, sizes, [os.getpid()], options
+                )
+        finally:
+            if not options["media_root"]:
+                shutil.rmtree(media_root, ignore_errors=True)
+        self._report(result, options["json"])
+
+    def _run(self, make_transport, mix, sizes, pids, options) -> dict:
+        datasets = {}
+        users = []
+        for i in range(options["users"]):
+            n_rows = sizes[i % len(sizes)]
+            seed = i if options["unique_data"] else n_rows
+            if (n_rows, seed) not in datasets:
+                datasets[(n_rows, seed)] = make_csv(n_rows, seed)
+            users.append(
+                VirtualUser(
+                    make_transport(),
+                    datasets[(n_rows, seed)],
+                    n_rows,
+                    mix,
+                    options["model"],
+                    seed=i,
+                )
+            )
+
+        self.stdout.write(
+            f"{len(users)} usuário(s), CSVs de {', '.join(map(str, sorted(set(sizes))))} "
+            f"linhas, mix {mix}, "
+            + (
+                f"{options['requests']} requisição(ões) por usuário."
+                if options["requests"]
+                else f"{options['duration']:g} s."
+            )
+        )
+
+        records = []
+        records_lock = threading.Lock()
+        deadline = time.perf_counter() + options["duration"]
+
+        def run_user(user):
+            done = 0
+            try:
+                while True:
+                    if options["requests"]:
+                        if done >= options["requests"]:
+                            break
+                    elif time.perf_counter() >= deadline:
+                        break
+                    record = user.step()
+                    done += 1
+                    with records_lock:
+                        records.append(record)
+                    if options["think"]:
+                        time.sleep(random.uniform(0, 2 * options["think"]))
+            finally:
+                user.transport.close()
+
+        sampler = MemorySampler(pids)
+        sampler.start()
+        start = time.perf_counter()
+        threads = [threading.Thread(target=run_user, args=(u,)) for u in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall_seconds = time.perf_counter() - start
+        sampler.stop()
+
+        return {
+            "alvo": options["url"] or "processo local",
+            "usuarios": len(users),
+            "segundos": round(wall_seconds, 2),
+            "endpoints": summarize(records, wall_seconds),
+            "memoria": sampler.summary(),
+        }
+
+    def _report(self, result: dict, json_path: str | None):
+        header = f"{'endpoint':<12}{'req':>7}{'erros':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>9}"
+        self.stdout.write(header)
+        for name, row in result["endpoints"].items():
+            self.stdout.write(
+                f"{name:<12}{row['requisicoes']:>7}{row['erros']:>7}"
+                f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}"
+                f"{row['req_por_s']:>9}"
+            )
+        for name, row in result["endpoints"].items():
+            if name == "total":
+                continue
+            for error in row["exemplos_de_erro"]:
+                self.stdout.write(self.style.ERROR(f"{name}: {error}"))
+
+        for pid, memory in result["memoria"].items():
+            self.stdout.write(
+                f"Memória do processo {pid}: {memory['inicio_mb']} MB no início, "
+                f"pico de {memory['pico_mb']} MB, {memory['fim_mb']} MB no fim."
+            )
+        if not result["memoria"]:
+            self.stdout.write(
+                "Memória dos workers não medida (use --server-pid com --url)."
+            )
+        self.stdout.write(f"Duração: {result['segundos']} s.")
+
+        if json_path:
+            with open(json_path, "w", encoding="utf-8") as fh:
+                json.dump(result, fh, ensure_ascii=False, indent=2)
+            self.stdout.write(f"Resultado gravado em {json_path}.")
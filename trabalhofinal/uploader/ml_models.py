@@ -1,6 +1,9 @@
+import numpy as np
 import pandas as pd
+import scipy.sparse as sp
+from django.conf import settings
 from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler, OneHotEncoder, LabelEncoder
+from sklearn.preprocessing import StandardScaler, OneHotEncoder
 from sklearn.impute import SimpleImputer
 from sklearn.compose import ColumnTransformer
 from sklearn.pipeline import Pipeline
@@ -10,12 +13,33 @@ from sklearn.neighbors import KNeighborsClassifier
 from sklearn.tree import DecisionTreeClassifier
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.linear_model import LogisticRegression
-from sklearn.svm import SVC
+from sklearn.svm import SVC, LinearSVC
+from sklearn.calibration import CalibratedClassifierCV
+from sklearn.kernel_approximation import Nystroem
+from sklearn.decomposition import TruncatedSVD
 
+from .feature_store import get_feature_set
+from .inference import CompiledModel, get_model, register_model
+from .lazy_dataset import LazyDataset
 
-def _get_model(model_name, hp_params):
+
+def _scale_limits() -> dict:
+    return {
+        "svm_max_rows": getattr(settings, "ML_SVM_MAX_ROWS", 10_000),
+        "knn_max_rows": getattr(settings, "ML_KNN_MAX_ROWS", 50_000),
+        "max_features": getattr(settings, "ML_SCALE_MAX_FEATURES", 200),
+        "max_train_rows": getattr(settings, "ML_MAX_TRAIN_ROWS", 200_000),
+        "nystroem_components": getattr(settings, "ML_NYSTROEM_COMPONENTS", 300),
+        "knn_svd_components": getattr(settings, "ML_KNN_SVD_COMPONENTS", 50),
+        "kdtree_max_features": getattr(settings, "ML_KNN_KDTREE_MAX_FEATURES", 15),
+    }
+
+
+def _get_model(model_name, hp_params, n_rows=0, n_features=0):
     """
-    Limpa os hiperparâmetros (de string para número) e retorna uma instância do modelo.
+    Limpa os hiperparâmetros (de string para número) e retorna uma instância do modelo
+    e uma descrição do motor usado. Para KNN e SVM em bases grandes, troca o
+    estimador por um equivalente escalável (limites em `_scale_limits`).
     """
     cleaned_hps = {}
     for k, v in hp_params.items():
@@ -29,25 +53,72 @@ def _get_model(model_name, hp_params):
             except ValueError:
                 cleaned_hps[k] = v
 
+    limits = _scale_limits()
+
     if model_name == "KNN":
-        return KNeighborsClassifier(**cleaned_hps)
+        if n_rows <= limits["knn_max_rows"]:
+            return KNeighborsClassifier(**cleaned_hps), "KNN"
+        if n_features <= limits["kdtree_max_features"]:
+            knn_hps = {"algorithm": "kd_tree"}
+            knn_hps.update(cleaned_hps)
+            return KNeighborsClassifier(**knn_hps), "KNN com índice KD-tree (base grande)"
+        # Árvores (KD ou Ball) degradam com dezenas de dimensões: depois da
+        # projeção, a busca exata em força bruta é a mais rápida.
+        n_components = min(limits["knn_svd_components"], max(n_features - 1, 1))
+        knn_hps = {"algorithm": "brute"}
+        knn_hps.update(cleaned_hps)
+        model = Pipeline(
+            steps=[
+                ("svd", TruncatedSVD(n_components=n_components, random_state=42)),
+                ("knn", KNeighborsClassifier(**knn_hps)),
+            ]
+        )
+        return model, (
+            f"KNN em força bruta sobre projeção SVD com {n_components}"
+            " componentes (base grande com mais de"
+            f" {limits['kdtree_max_features']} colunas)"
+        )
     if model_name == "DecisionTree":
-        return DecisionTreeClassifier(**cleaned_hps)
+        return DecisionTreeClassifier(**cleaned_hps), "Decision Tree"
     if model_name == "RandomForest":
-        return RandomForestClassifier(**cleaned_hps)
+        return RandomForestClassifier(**cleaned_hps), "Random Forest"
     if model_name == "LogisticRegression":
-        return LogisticRegression(max_iter=1000, **cleaned_hps)
+        return LogisticRegression(max_iter=1000, **cleaned_hps), "Logistic Regression"
     if model_name == "SVM":
-        base_hps = {"probability": True}
-        base_hps.update(cleaned_hps)
-        return SVC(**base_hps)
+        if n_rows <= limits["svm_max_rows"]:
+            base_hps = {"probability": True}
+            base_hps.update(cleaned_hps)
+            return SVC(**base_hps), "SVC com kernel e calibração interna"
+
+        kernel = cleaned_hps.pop("kernel", "rbf")
+        gamma = cleaned_hps.pop("gamma", None)
+        linear = CalibratedClassifierCV(
+            LinearSVC(**cleaned_hps), method="sigmoid", cv=3
+        )
+        if kernel == "linear" or n_features > limits["max_features"]:
+            return linear, "LinearSVC + calibração sigmoide (base grande)"
+
+        nystroem_hps = {"kernel": kernel, "random_state": 42}
+        if gamma not in (None, "scale", "auto"):
+            nystroem_hps["gamma"] = gamma
+        n_components = min(limits["nystroem_components"], n_rows)
+        model = Pipeline(
+            steps=[
+                ("nystroem", Nystroem(n_components=n_components, **nystroem_hps)),
+                ("svm", linear),
+            ]
+        )
+        return model, (
+            f"Aproximação de kernel Nystroem ({n_components} componentes)"
+            " + LinearSVC calibrado (base grande)"
+        )
 
     raise ValueError(f"Modelo desconhecido: {model_name}")
 
 
-def _get_pipeline(X, Y_raw, model_name, hp_params):
+def _get_preprocessor(X):
     """
-    Cria o pipeline de pré-processamento e o modelo final.
+    Cria o pré-processamento (imputação, padronização e one-hot) das features.
     """
 
     numeric_features = X.select_dtypes(include=["number"]).columns
@@ -67,60 +138,125 @@ def _get_pipeline(X, Y_raw, model_name, hp_params):
         ]
     )
 
-    preprocessor = ColumnTransformer(
+    return ColumnTransformer(
         transformers=[
             ("num", numeric_transformer, numeric_features),
             ("cat", categorical_transformer, categorical_features),
         ]
     )
 
+
+def _to_dense(matrix):
+    return matrix.toarray() if sp.issparse(matrix) else np.asarray(matrix)
+
+
+def _subsample_train(X_train, Y_train, max_rows):
+    """
+    Limita o conjunto de treino a `max_rows` linhas (estratificado quando possível).
+    """
+    if X_train.shape[0] <= max_rows:
+        return X_train, Y_train
     try:
-        model = _get_model(model_name, hp_params)
-    except Exception as e:
-        print(f"Erro ao instanciar modelo com HPs {hp_params}: {e}. Usando defaults.")
-        model = _get_model(model_name, {})
+        X_train, _, Y_train, _ = train_test_split(
+            X_train, Y_train, train_size=max_rows, random_state=42, stratify=Y_train
+        )
+    except ValueError:
+        X_train, _, Y_train, _ = train_test_split(
+            X_train, Y_train, train_size=max_rows, random_state=42
+        )
+    return X_train, Y_train
 
-    main_pipeline = Pipeline(
-        steps=[("preprocessor", preprocessor), ("classifier", model)]
-    )
 
-    le = LabelEncoder().fit(Y_raw)
-    return main_pipeline, le
+def _predict_output(compiled: CompiledModel, new_data_dict: dict) -> dict:
+    try:
+        cleaned_data_dict = {
+            k.replace("X_", "", 1): v
+            for k, v in new_data_dict.items()
+            if k.startswith("X_")
+        }
+        result = compiled.predict(cleaned_data_dict)
+        return {
+            "output": f"Predição: classe='{result['label']}' / score={result['score']:.2f}",
+            "metrics": compiled.metrics,
+        }
+    except Exception as e:
+        return {"output": f"Erro na predição: {e}", "metrics": compiled.metrics}
 
 
 def run_ml_task(
-    df: pd.DataFrame, model_name: str, hp_params: dict, new_data_dict: dict, action: str
+    df: pd.DataFrame | LazyDataset,
+    model_name: str,
+    hp_params: dict,
+    new_data_dict: dict,
+    action: str,
+    dataset_key: str | None = None,
 ):
     """
     Função principal que orquestra o pipeline de ML.
+    `df` pode ser um `LazyDataset`: os dados só são carregados se o feature
+    store do dataset ainda não existir.
+    Com `dataset_key`, o modelo treinado é compilado e guardado para o
+    caminho rápido de inferência, e predições reaproveitam o modelo já
+    treinado com os mesmos hiperparâmetros em vez de treinar de novo.
     """
-    try:
-        X = df.iloc[:, :-1]
-        Y_raw = df.iloc[:, -1]
-    except Exception as e:
-        return {
-            "output": f"Erro ao separar X e Y. A base precisa ter ao menos 2 colunas. Erro: {e}",
-            "metrics": "N/A",
-        }
+    if action == "predict" and dataset_key:
+        compiled = get_model(dataset_key, model_name, hp_params)
+        if compiled is not None:
+            return _predict_output(compiled, new_data_dict)
+
+    def load_xy():
+        data = df.load() if isinstance(df, LazyDataset) else df
+        if data.empty or len(data.columns) < 2:
+            raise ValueError(
+                "Os dados limpos estão vazios ou não têm colunas suficientes (mínimo 2)."
+            )
+        return data.iloc[:, :-1], data.iloc[:, -1]
 
     try:
-        pipeline, le = _get_pipeline(X, Y_raw, model_name, hp_params)
-        Y = le.transform(Y_raw)
+        # Codificação do alvo, split e matrizes transformadas não dependem do
+        # modelo: vêm do feature store do dataset quando já calculadas.
+        features = get_feature_set(dataset_key, load_xy, _get_preprocessor)
     except Exception as e:
         return {"output": f"Erro ao construir pipeline: {e}", "metrics": "N/A"}
 
-    X_train, X_test, Y_train, Y_test = train_test_split(
-        X, Y, test_size=0.2, random_state=42, stratify=Y
+    n_train_full = len(features.Y_train)
+    X_train, Y_train = _subsample_train(
+        features.X_train, features.Y_train, _scale_limits()["max_train_rows"]
     )
+    X_test = features.X_test
+
+    try:
+        model, engine = _get_model(
+            model_name, hp_params, len(Y_train), features.n_features
+        )
+    except Exception as e:
+        print(f"Erro ao instanciar modelo com HPs {hp_params}: {e}. Usando defaults.")
+        model, engine = _get_model(model_name, {}, len(Y_train), features.n_features)
+
+    if isinstance(model, KNeighborsClassifier) and model.algorithm == "kd_tree":
+        # KD-tree exige matriz densa na entrada.
+        X_train, X_test = _to_dense(X_train), _to_dense(X_test)
 
     try:
-        pipeline.fit(X_train, Y_train)
+        model.fit(X_train, Y_train)
     except Exception as e:
         return {"output": f"Erro ao treinar modelo: {e}", "metrics": "N/A"}
 
-    Y_pred = pipeline.predict(X_test)
-    acc = accuracy_score(Y_test, Y_pred)
-    metrics = f"acc={acc:.2f} (baseado em split 80/20 da base original)"
+    Y_pred = model.predict(X_test)
+    acc = accuracy_score(features.Y_test, Y_pred)
+    metrics = f"acc={acc:.2f} (baseado em split 80/20 da base original) | motor: {engine}"
+    if len(Y_train) < n_train_full:
+        metrics += f" | treino subamostrado: {len(Y_train)} de {n_train_full} linhas"
+
+    pipeline = Pipeline(
+        steps=[("preprocessor", features.preprocessor), ("classifier", model)]
+    )
+    compiled = CompiledModel.from_pipeline(pipeline, features.label_encoder, metrics)
+    if dataset_key:
+        try:
+            register_model(dataset_key, model_name, hp_params, compiled)
+        except (IOError, OSError) as e:
+            print(f"Erro ao salvar modelo compilado: {e}")
 
     if action == "retrain":
         return {
@@ -129,37 +265,6 @@ def run_ml_task(
         }
 
     if action == "predict":
-        try:
-            cleaned_data_dict = {
-                k.replace("X_", ""): v
-                for k, v in new_data_dict.items()
-                if k.startswith("X_")
-            }
-
-            new_data_df = pd.DataFrame([cleaned_data_dict])
-            for col in new_data_df.columns:
-                if col in X.columns:
-                    try:
-                        new_data_df[col] = new_data_df[col].astype(X[col].dtype)
-                    except Exception:
-                        new_data_df[col] = pd.to_numeric(
-                            new_data_df[col], errors="ignore"
-                        )
-
-            pred_encoded = pipeline.predict(new_data_df)
-            pred_proba = pipeline.predict_proba(new_data_df)
-
-            prediction_label = le.inverse_transform(pred_encoded)[0]
-
-            score_index = pred_encoded[0]
-            score = pred_proba[0][score_index]
-
-            return {
-                "output": f"Predição: classe='{prediction_label}' / score={score:.2f}",
-                "metrics": metrics,
-            }
-
-        except Exception as e:
-            return {"output": f"Erro na predição: {e}", "metrics": metrics}
+        return _predict_output(compiled, new_data_dict)
 
     return {"output": "Ação desconhecida.", "metrics": "N/A"}
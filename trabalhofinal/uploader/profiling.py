@@ -0,0 +1,289 @@
+"""
+Perfil de desempenho opcional de uma requisição (análise ou predição).
+
+Ativado por `?perfil=1` para usuários staff, ou para todas as requisições
+com `ANALYSIS_PROFILING = True` no settings. A view roda sob o cProfile
+(tempo por função) e, em paralelo, um amostrador de pilhas que gera o
+arquivo no formato "collapsed stacks" (uma pilha por linha seguida da
+contagem), aceito por flamegraph.pl, speedscope e afins.
+
+Os artefatos ficam em `datasets/<chave>/perfis/<id>/`:
+
+* `resumo.json`: funções com maior tempo acumulado e tempo por categoria
+  (métodos do DataAnalyzer, serialização Plotly, fit/predict do sklearn).
+* `perfil.prof`: saída do cProfile (pstats, snakeviz).
+* `perfil.folded`: pilhas amostradas, para gerar o flamegraph.
+
+Só a thread da requisição é perfilada: trabalho feito em pools de
+processos (sketches, imagens estáticas) aparece como espera.
+"""
+
+import cProfile
+import functools
+import json
+import os
+import pstats
+import re
+import secrets
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+
+from .datasets import DATASET_KEY, dataset_dir
+
+PROFILES_DIRNAME = "perfis"
+SUMMARY_FILENAME = "resumo.json"
+STATS_FILENAME = "perfil.prof"
+FOLDED_FILENAME = "perfil.folded"
+PROFILE_FILES = (SUMMARY_FILENAME, STATS_FILENAME, FOLDED_FILENAME)
+PROFILE_ID = re.compile(r"^\d{8}-\d{6}-[a-z_]+-[0-9a-f]{6}$")
+
+SKLEARN_METHODS = {
+    "fit",
+    "fit_transform",
+    "transform",
+    "predict",
+    "predict_proba",
+    "decision_function",
+}
+
+# Categoria -> função que recebe (arquivo, nome da função) do pstats.
+CATEGORIES = {
+    "DataAnalyzer": lambda path, name: path.endswith(
+        os.path.join("uploader", "analytics.py")
+    ),
+    "Serialização Plotly": lambda path, name: os.path.join("plotly", "io") in path,
+    "sklearn fit/predict": lambda path, name: (
+        os.sep + "sklearn" + os.sep in path and name in SKLEARN_METHODS
+    ),
+    "Leitura de CSV": lambda path, name: path.endswith(
+        os.path.join("uploader", "csv_reader.py")
+    ),
+}
+
+
+class StackSampler:
+    """
+    Amostra periodicamente a pilha de uma thread e conta as pilhas iguais,
+    no estilo do py-spy, mas dentro do próprio processo.
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_qualname}")
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.counts.items())
+
+
+def profiling_enabled(request) -> bool:
+    if getattr(settings, "ANALYSIS_PROFILING", False):
+        return True
+    user = getattr(request, "user", None)
+    return request.GET.get("perfil") == "1" and bool(user and user.is_staff)
+
+
+def _short_path(path: str) -> str:
+    parts = path.replace("\\", "/").split("/")
+    return "/".join(parts[-2:])
+
+
+def _nested_members(stats: pstats.Stats, members: set) -> set:
+    """
+    Funções de `members` com outra função de `members` em algum ponto da
+    cadeia de chamadores (ex: `fit` de uma árvore chamado pelo `fit` da
+    floresta através do joblib).
+    """
+    callees = defaultdict(set)
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        for caller in callers:
+            callees[caller].add(func)
+
+    # Funções alcançáveis a partir de alguma da categoria; as demais não
+    # levam a nenhuma e não precisam ser percorridas.
+    reached = set()
+    stack = list(members)
+    while stack:
+        for callee in callees[stack.pop()]:
+            if callee not in reached:
+                reached.add(callee)
+                stack.append(callee)
+
+    nested = set()
+    for func in members & reached:
+        seen = {func}
+        stack = [func]
+        while stack and func not in nested:
+            for caller in stats.stats.get(stack.pop(), (0, 0, 0, 0, {}))[4]:
+                if caller in seen:
+                    continue
+                if caller in members:
+                    nested.add(func)
+                    break
+                seen.add(caller)
+                if caller in reached:
+                    stack.append(caller)
+    return nested
+
+
+def _category_times(stats: pstats.Stats) -> dict:
+    """
+    Tempo acumulado de cada categoria, somando só as funções da categoria
+    sem outra da mesma categoria entre os chamadores, diretos ou não (sem
+    contar duas vezes o tempo de chamadas aninhadas).
+    """
+    totals = {}
+    for category, matches in CATEGORIES.items():
+        members = {func for func in stats.stats if matches(func[0], func[2])}
+        nested = _nested_members(stats, members)
+        total = sum((stats.stats[func][3] for func in members - nested), 0.0)
+        totals[category] = round(total, 4)
+    return totals
+
+
+def summarize(profile: cProfile.Profile, top: int = 30) -> dict:
+    stats = pstats.Stats(profile)
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+    functions = []
+    for (path, line, name), (cc, nc, tt, ct, _) in rows[:top]:
+        functions.append(
+            {
+                "funcao": f"{_short_path(path)}:{line}({name})",
+                "chamadas": nc,
+                "tempo_proprio": round(tt, 4),
+                "tempo_acumulado": round(ct, 4),
+            }
+        )
+    return {"categorias": _category_times(stats), "funcoes": functions}
+
+
+def profiles_dir(key: str) -> str:
+    path = os.path.join(dataset_dir(key), PROFILES_DIRNAME)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def save_profile(key: str, view_name: str, request, profile, sampler, seconds):
+    profile_id = "-".join(
+        [time.strftime("%Y%m%d-%H%M%S"), view_name, secrets.token_hex(3)]
+    )
+    directory = os.path.join(profiles_dir(key), profile_id)
+    os.makedirs(directory)
+
+    profile.dump_stats(os.path.join(directory, STATS_FILENAME))
+    with open(os.path.join(directory, FOLDED_FILENAME), "w", encoding="utf-8") as fh:
+        fh.write(sampler.collapsed())
+
+    summary = {
+        "id": profile_id,
+        "view": view_name,
+        "metodo": request.method,
+        "caminho": request.get_full_path(),
+        "criado_em": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "segundos": round(seconds, 4),
+        "amostras": sum(sampler.counts.values()),
+        **summarize(profile, getattr(settings, "ANALYSIS_PROFILING_TOP", 30)),
+    }
+    with open(os.path.join(directory, SUMMARY_FILENAME), "w", encoding="utf-8") as fh:
+        json.dump(summary, fh, ensure_ascii=False, indent=2)
+    return profile_id
+
+
+def list_profiles(key: str) -> list[dict]:
+    if not DATASET_KEY.match(key):
+        return []
+    profiles = []
+    directory = profiles_dir(key)
+    for profile_id in sorted(os.listdir(directory), reverse=True):
+        summary = load_profile(key, profile_id)
+        if summary is not None:
+            profiles.append(summary)
+    return profiles
+
+
+def load_profile(key: str, profile_id: str) -> dict | None:
+    if not DATASET_KEY.match(key) or not PROFILE_ID.match(profile_id):
+        return None
+    path = os.path.join(profiles_dir(key), profile_id, SUMMARY_FILENAME)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as fh:
+            return json.load(fh)
+    except (IOError, ValueError) as e:
+        print(f"Erro ao ler perfil {path}: {e}")
+        return None
+
+
+def profile_file_path(key: str, profile_id: str, filename: str) -> str | None:
+    if (
+        not DATASET_KEY.match(key)
+        or not PROFILE_ID.match(profile_id)
+        or filename not in PROFILE_FILES
+    ):
+        return None
+    path = os.path.join(profiles_dir(key), profile_id, filename)
+    return path if os.path.exists(path) else None
+
+
+def profile_request(view):
+    """
+    Decorador das views perfiláveis. Sem perfil ativo, apenas chama a view.
+    Com perfil, grava os artefatos junto do dataset da sessão e informa o
+    id no cabeçalho `X-Perfil`.
+    """
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not profiling_enabled(request):
+            return view(request, *args, **kwargs)
+
+        sampler = StackSampler(
+            threading.get_ident(),
+            getattr(settings, "ANALYSIS_PROFILING_INTERVAL", 0.005),
+        )
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            response = profile.runcall(view, request, *args, **kwargs)
+        finally:
+            sampler.stop()
+        seconds = time.perf_counter() - start
+
+        key = request.session.get("dataset_key")
+        if key:
+            try:
+                profile_id = save_profile(
+                    key, view.__name__, request, profile, sampler, seconds
+                )
+                response["X-Perfil"] = profile_id
+            except (IOError, OSError) as e:
+                print(f"Erro ao salvar perfil da requisição: {e}")
+        return response
+
+    return wrapper
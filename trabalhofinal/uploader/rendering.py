@@ -0,0 +1,181 @@
+"""
+Modo de renderização estática dos gráficos: cada figura vira um arquivo de
+imagem (PNG, SVG ou WebP) e uma página interativa, gravados em
+`MEDIA_ROOT/figuras/` com o nome derivado do hash da especificação da
+figura. Como o nome muda sempre que o conteúdo muda, navegador e proxies
+podem guardar os arquivos em cache indefinidamente, e uma figura já
+renderizada nunca é renderizada de novo.
+
+As imagens são geradas num pool de processos. Figuras Plotly precisam do
+pacote opcional `kaleido`; sem ele, continuam interativas.
+"""
+
+import glob
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib.pyplot as plt
+import plotly.graph_objects as go
+import plotly.io as pio
+from django.conf import settings
+from django.urls import reverse
+
+try:
+    import kaleido  # noqa: F401
+
+    HAS_KALEIDO = True
+except ImportError:
+    HAS_KALEIDO = False
+
+FIGURES_DIRNAME = "figuras"
+STATIC_FORMATS = ("png", "svg", "webp")
+FIGURE_NAME = re.compile(r"^[0-9a-f]{32}\.(png|svg|webp|html)$")
+FIGURE_REFERENCE = re.compile(r"[0-9a-f]{32}\.(?:png|svg|webp|html)")
+# Figuras recém-gravadas podem pertencer a um relatório ainda não salvo.
+UNUSED_FIGURE_MIN_AGE = 3600
+
+_executor = None
+_lock = threading.Lock()
+
+
+def figures_dir() -> str:
+    path = os.path.join(settings.MEDIA_ROOT, FIGURES_DIRNAME)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def figure_url(filename: str) -> str:
+    return reverse("figure_file", args=[filename])
+
+
+def remove_unused_figures(min_age: float = UNUSED_FIGURE_MIN_AGE) -> int:
+    """
+    Apaga as figuras que nenhum relatório salvo referencia mais (ex: depois
+    que os datasets que as usavam foram liberados). As figuras são
+    compartilhadas entre datasets, então só o conjunto de relatórios diz se
+    ainda estão em uso. Devolve quantos arquivos foram apagados.
+    """
+    referenced = set()
+    pattern = os.path.join(settings.MEDIA_ROOT, "datasets", "*", "report*.json")
+    for path in glob.glob(pattern):
+        try:
+            with open(path, encoding="utf-8") as fh:
+                referenced.update(FIGURE_REFERENCE.findall(fh.read()))
+        except IOError:
+            continue
+
+    removed = 0
+    directory = figures_dir()
+    cutoff = time.time() - min_age
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            if name not in referenced and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            continue
+    return removed
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=getattr(settings, "ANALYSIS_RENDER_WORKERS", 2)
+            )
+        return _executor
+
+
+def _write(path: str, content: bytes):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as fh:
+        fh.write(content)
+    os.replace(tmp_path, path)
+
+
+def _render_plotly(fig_json: str, fmt: str, directory: str, name: str):
+    """Executado no pool: grava a página interativa e depois a imagem."""
+    fig = pio.from_json(fig_json)
+    html_path = os.path.join(directory, f"{name}.html")
+    if not os.path.exists(html_path):
+        _write(
+            html_path,
+            fig.to_html(full_html=True, include_plotlyjs="cdn").encode("utf-8"),
+        )
+    _write(os.path.join(directory, f"{name}.{fmt}"), fig.to_image(format=fmt))
+
+
+class StaticRenderer:
+    """
+    Renderiza as figuras de uma análise para arquivos. `render(fig)` devolve
+    na hora os campos do gráfico (`image` e `interactive`, com as URLs) e
+    agenda a renderização; `finish(plots)` espera o pool e, se alguma imagem
+    falhar, deixa só a versão interativa daquele gráfico.
+    """
+
+    def __init__(self, fmt: str = "png"):
+        if fmt not in STATIC_FORMATS:
+            raise ValueError(f"Formato estático inválido: {fmt}")
+        self.fmt = fmt
+        self.variant = f"estatico-{fmt}"
+        self.directory = figures_dir()
+        self._pending = {}
+
+    def render(self, fig) -> dict | None:
+        if isinstance(fig, plt.Figure):
+            return self._render_matplotlib(fig)
+        if isinstance(fig, go.Figure) and HAS_KALEIDO:
+            return self._render_plotly(fig)
+        return None
+
+    def _render_matplotlib(self, fig) -> dict:
+        buf = io.BytesIO()
+        fig.savefig(buf, format=self.fmt, bbox_inches="tight")
+        plt.close(fig)
+        content = buf.getvalue()
+        filename = f"{hashlib.sha256(content).hexdigest()[:32]}.{self.fmt}"
+        path = os.path.join(self.directory, filename)
+        if not os.path.exists(path):
+            _write(path, content)
+        return {"image": figure_url(filename)}
+
+    def _render_plotly(self, fig) -> dict:
+        fig_json = fig.to_json()
+        spec = json.dumps([self.fmt, fig_json])
+        name = hashlib.sha256(spec.encode("utf-8")).hexdigest()[:32]
+        image = f"{name}.{self.fmt}"
+        if not os.path.exists(os.path.join(self.directory, image)):
+            self._pending[figure_url(image)] = (
+                name,
+                _get_executor().submit(
+                    _render_plotly, fig_json, self.fmt, self.directory, name
+                ),
+            )
+        return {"image": figure_url(image), "interactive": figure_url(f"{name}.html")}
+
+    def finish(self, plots: list[dict]) -> list[dict]:
+        failed = {}
+        for url, (name, future) in self._pending.items():
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Erro ao renderizar figura estática {url}: {e}")
+                failed[url] = name
+        self._pending = {}
+        for plot in plots:
+            name = failed.get(plot.get("image"))
+            if name is None:
+                continue
+            del plot["image"]
+            if not os.path.exists(os.path.join(self.directory, f"{name}.html")):
+                del plot["interactive"]
+                plot["html"] = "<p>Não foi possível renderizar este gráfico.</p>"
+        return plots
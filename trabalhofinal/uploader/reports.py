@@ -0,0 +1,125 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .analytics import DataAnalyzer
+from .datasets import dataset_dir, get_analyzer_options
+from .lazy_dataset import LazyDataset
+
+REPORT_FILENAME = "report.json"
+
+STATUS_READY = "pronto"
+STATUS_RUNNING = "processando"
+STATUS_FAILED = "falhou"
+
+_executor = None
+_futures = {}
+_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "ANALYSIS_BACKGROUND_WORKERS", 1)
+            )
+        return _executor
+
+
+def collect_plots(analyzer: DataAnalyzer) -> list[dict]:
+    plots = []
+    plots.extend(analyzer.generate_basic_plots())
+    plots.extend(analyzer.generate_advanced_plots())
+    geo_plot = analyzer.generate_geo_visualization()
+    if geo_plot:
+        plots.append(geo_plot)
+    plots.extend(analyzer.generate_temporal_plots())
+    if analyzer.renderer is not None:
+        analyzer.renderer.finish(plots)
+    return plots
+
+
+def group_plots(plots: list[dict]) -> dict:
+    grouped_plots = {}
+    for plot in plots:
+        section = plot.get("section", "Geral")
+        if section not in grouped_plots:
+            grouped_plots[section] = []
+        grouped_plots[section].append(plot)
+    return grouped_plots
+
+
+def report_path(key: str, variant: str | None = None) -> str:
+    filename = REPORT_FILENAME
+    if variant:
+        filename = f"report-{variant}.json"
+    return os.path.join(dataset_dir(key), filename)
+
+
+def load_report(key: str, variant: str | None = None) -> dict | None:
+    """
+    Retorna os gráficos agrupados de um relatório completo já calculado,
+    ou None se ainda não existir. `variant` identifica versões alternativas
+    do relatório (ex: `StaticRenderer.variant`, com imagens estáticas).
+    """
+    path = report_path(key, variant)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as fh:
+            return json.load(fh)
+    except (IOError, ValueError) as e:
+        print(f"Erro ao ler relatório salvo {path}: {e}")
+        return None
+
+
+def save_report(key: str, grouped_plots: dict, variant: str | None = None):
+    path = report_path(key, variant)
+    # Duas requisições podem gravar o mesmo relatório ao mesmo tempo.
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(grouped_plots, fh)
+    os.replace(tmp_path, path)
+
+
+def build_full_report(key: str, full_fs_path) -> dict:
+    analyzer = DataAnalyzer.from_dataset(
+        LazyDataset(key, full_fs_path), **get_analyzer_options()
+    )
+    grouped_plots = group_plots(collect_plots(analyzer))
+    save_report(key, grouped_plots)
+    return grouped_plots
+
+
+def request_full_report(key: str, full_fs_path):
+    """
+    Agenda o cálculo do relatório completo em segundo plano. Chamadas
+    repetidas para o mesmo dataset não duplicam o trabalho.
+    """
+    if os.path.exists(report_path(key)):
+        return
+    executor = _get_executor()
+    with _lock:
+        future = _futures.get(key)
+        if future is not None and not future.done():
+            return
+        _futures[key] = executor.submit(build_full_report, key, full_fs_path)
+
+
+def report_status(key: str) -> str | None:
+    if os.path.exists(report_path(key)):
+        return STATUS_READY
+    with _lock:
+        future = _futures.get(key)
+    if future is None:
+        return None
+    if not future.done():
+        return STATUS_RUNNING
+    if future.exception() is not None:
+        print(f"Erro no relatório em segundo plano ({key}): {future.exception()}")
+        return STATUS_FAILED
+    return STATUS_READY
@@ -0,0 +1,341 @@
+"""
+Estruturas de resumo aproximado ("sketches") para perfilar colunas grandes
+ou lidas em blocos, com memória limitada e independente do número de linhas.
+
+Todas as estruturas são combináveis (`merge`), então podem ser calculadas
+por bloco, em paralelo, e depois unidas:
+
+* `HyperLogLog`: contagem aproximada de valores distintos.
+* `MisraGries`: itens mais frequentes (heavy hitters) com erro limitado.
+* `TDigest`: quantis aproximados.
+* `Moments`: contagem, média, variância, mínimo e máximo (exatos).
+"""
+
+import math
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+HLL_PRECISION = 12
+MISRA_GRIES_COUNTERS = 200
+TDIGEST_COMPRESSION = 100
+
+
+def _hash_values(values: pd.Series) -> np.ndarray:
+    """
+    Hash de 64 bits de cada valor (sem nulos). Números são convertidos para
+    float64 antes: um bloco de uma coluna inteira que tenha um nulo é lido
+    como float, e `5` e `5.0` precisam cair no mesmo registrador. Somar 0.0
+    une `0.0` e `-0.0`, como em `dedup`.
+    """
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        values = values.astype("float64") + 0.0
+    return pd.util.hash_pandas_object(values, index=False).to_numpy(dtype=np.uint64)
+
+
+def _bit_length(values: np.ndarray) -> np.ndarray:
+    """
+    Número de bits significativos de cada inteiro sem sinal (vetorizado).
+    """
+    x = values.copy()
+    n = np.zeros(len(x), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        mask = x >= np.uint64(1 << shift)
+        n[mask] += shift
+        x[mask] >>= np.uint64(shift)
+    n += x > 0
+    return n
+
+
+class HyperLogLog:
+    """
+    Estimativa do número de valores distintos com erro padrão relativo de
+    1.04 / sqrt(2 ** precision) (~1,6% com a precisão padrão).
+    """
+
+    def __init__(self, precision: int = HLL_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def add(self, values: pd.Series):
+        values = values.dropna()
+        if values.empty:
+            return
+        hashes = _hash_values(values)
+        suffix_bits = 64 - self.precision
+        index = (hashes >> np.uint64(suffix_bits)).astype(np.int64)
+        suffix = hashes & np.uint64((1 << suffix_bits) - 1)
+        rank = (suffix_bits - _bit_length(suffix) + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other: "HyperLogLog"):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.power(2.0, -self.registers.astype(float)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Correção para cardinalidades pequenas (contagem linear).
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+
+class MisraGries:
+    """
+    Resumo de Misra-Gries combinável com `k` contadores. Cada contagem
+    estimada subestima a real em no máximo `error` (<= n / (k + 1)); se a
+    coluna tiver até `k` valores distintos, as contagens são exatas.
+    """
+
+    def __init__(self, k: int = MISRA_GRIES_COUNTERS):
+        self.k = k
+        self.counters = {}
+        self.n = 0
+        self.error = 0
+
+    def _combine(self, counts: pd.Series):
+        combined = counts.add(pd.Series(self.counters, dtype="int64"), fill_value=0)
+        if len(combined) > self.k:
+            cut = int(combined.nlargest(self.k + 1).iloc[-1])
+            self.error += cut
+            combined = combined[combined > cut] - cut
+        self.counters = combined.astype("int64").to_dict()
+
+    def add(self, values: pd.Series):
+        counts = values.value_counts()
+        self.n += int(counts.sum())
+        self._combine(counts)
+
+    def merge(self, other: "MisraGries"):
+        self.n += other.n
+        self.error += other.error
+        self._combine(pd.Series(other.counters, dtype="int64"))
+
+    def top(self, n: int) -> pd.Series:
+        return pd.Series(self.counters, dtype="int64").nlargest(n)
+
+    @property
+    def is_exact(self) -> bool:
+        return self.error == 0
+
+
+class TDigest:
+    """
+    Quantis aproximados (t-digest com fusão em lote). O erro é menor nas
+    caudas; `rank_error` dá o erro de posição máximo observado no resumo.
+    """
+
+    def __init__(self, compression: int = TDIGEST_COMPRESSION):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+
+    @property
+    def n(self) -> float:
+        return float(self.weights.sum())
+
+    @property
+    def rank_error(self) -> float:
+        if not len(self.weights):
+            return 0.0
+        return float(self.weights.max() / (2 * self.n))
+
+    def _compress(self, means: np.ndarray, weights: np.ndarray):
+        order = np.argsort(means, kind="mergesort")
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+
+        # Função de escala k1: cada centróide cobre no máximo uma unidade de k,
+        # o que mantém centróides pequenos (mais precisos) nas caudas.
+        q_left = (np.cumsum(weights) - weights) / total
+        k = self.compression / (2 * np.pi) * np.arcsin(2 * q_left - 1)
+        bucket = np.floor(k).astype(np.int64)
+        starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+
+        self.weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / self.weights
+
+    def add(self, values: pd.Series):
+        values = pd.to_numeric(values, errors="coerce").dropna().to_numpy(dtype=float)
+        if not len(values):
+            return
+        # Pré-agrega valores repetidos antes da fusão.
+        uniq, counts = np.unique(values, return_counts=True)
+        self._compress(
+            np.concatenate([self.means, uniq]),
+            np.concatenate([self.weights, counts.astype(float)]),
+        )
+
+    def merge(self, other: "TDigest"):
+        if not len(other.means):
+            return
+        self._compress(
+            np.concatenate([self.means, other.means]),
+            np.concatenate([self.weights, other.weights]),
+        )
+
+    def quantile(self, q: float) -> float:
+        if not len(self.means):
+            return float("nan")
+        if len(self.means) == 1:
+            return float(self.means[0])
+        cumulative = np.cumsum(self.weights) - self.weights / 2
+        return float(np.interp(q * self.n, cumulative, self.means))
+
+
+class Moments:
+    """
+    Contagem, média, variância (Welford/Chan), mínimo e máximo combináveis.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+
+    def _combine(self, n, mean, m2, vmin, vmax):
+        if not n:
+            return
+        total = self.n + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta**2 * self.n * n / total
+        self.n = total
+        self.min = min(self.min, vmin)
+        self.max = max(self.max, vmax)
+
+    def add(self, values: pd.Series):
+        values = pd.to_numeric(values, errors="coerce").dropna().to_numpy(dtype=float)
+        if not len(values):
+            return
+        mean = values.mean()
+        self._combine(
+            len(values), mean, ((values - mean) ** 2).sum(), values.min(), values.max()
+        )
+
+    def merge(self, other: "Moments"):
+        self._combine(other.n, other.mean, other.m2, other.min, other.max)
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else float("nan")
+
+
+class ColumnSketch:
+    """
+    Conjunto de sketches de uma coluna. Os numéricos (`Moments`/`TDigest`)
+    só são alimentados enquanto todos os blocos vistos forem numéricos.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.nulls = 0
+        self.distinct = HyperLogLog()
+        self.heavy_hitters = MisraGries()
+        self.numeric = True
+        self.moments = Moments()
+        self.quantiles = TDigest()
+
+    def add(self, values: pd.Series):
+        self.rows += len(values)
+        non_null = values.dropna()
+        self.nulls += len(values) - len(non_null)
+        self.distinct.add(non_null)
+        self.heavy_hitters.add(non_null)
+        if self.numeric and not non_null.empty:
+            if pd.api.types.is_numeric_dtype(non_null.dtype):
+                self.moments.add(non_null)
+                self.quantiles.add(non_null)
+            else:
+                self.numeric = False
+
+    def merge(self, other: "ColumnSketch"):
+        self.rows += other.rows
+        self.nulls += other.nulls
+        self.distinct.merge(other.distinct)
+        self.heavy_hitters.merge(other.heavy_hitters)
+        self.numeric = self.numeric and other.numeric
+        self.moments.merge(other.moments)
+        self.quantiles.merge(other.quantiles)
+
+    def nunique(self) -> int:
+        # Com poucos distintos, o Misra-Gries é exato e mais preciso que o HLL.
+        if self.heavy_hitters.is_exact:
+            return len(self.heavy_hitters.counters)
+        return self.distinct.count()
+
+    def describe(self) -> pd.Series:
+        """
+        Equivalente aproximado de `Series.describe()` para colunas numéricas.
+        """
+        return pd.Series(
+            {
+                "count": self.moments.n,
+                "mean": self.moments.mean,
+                "std": self.moments.std,
+                "min": self.moments.min,
+                "25%": self.quantiles.quantile(0.25),
+                "50%": self.quantiles.quantile(0.5),
+                "75%": self.quantiles.quantile(0.75),
+                "max": self.moments.max,
+            }
+        )
+
+
+def sketch_frame(df: pd.DataFrame, columns=None) -> dict:
+    columns = list(df.columns) if columns is None else columns
+    sketches = {}
+    for col in columns:
+        sketches[col] = ColumnSketch()
+        sketches[col].add(df[col])
+    return sketches
+
+
+def merge_sketches(target: dict, other: dict) -> dict:
+    for col, sketch in other.items():
+        if col in target:
+            target[col].merge(sketch)
+        else:
+            target[col] = sketch
+    return target
+
+
+def sketch_chunks(chunks, columns=None, workers: int = 1) -> dict:
+    """
+    Calcula os sketches de um iterável de DataFrames (ex: `read_csv` com
+    `chunksize`), em paralelo quando `workers > 1`, e une os resultados.
+    No máximo `2 * workers` blocos ficam em trânsito ao mesmo tempo (o
+    `executor.map` consumiria o iterável inteiro de uma vez), então a
+    memória continua limitada mesmo lendo um arquivo em streaming.
+    """
+    result = {}
+    if workers <= 1:
+        for chunk in chunks:
+            merge_sketches(result, sketch_frame(chunk, columns))
+        return result
+
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk in chunks:
+            if len(pending) >= 2 * workers:
+                merge_sketches(result, pending.popleft().result())
+            pending.append(executor.submit(sketch_frame, chunk, columns))
+        while pending:
+            merge_sketches(result, pending.popleft().result())
+    return result
+
+
+def split_frame(df: pd.DataFrame, chunk_rows: int):
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start : start + chunk_rows]
+
@@ -1,3 +1,789 @@
-from django.test import TestCase
+import cProfile
+import json
+import multiprocessing
+import os
+import pstats
+import shutil
+import subprocess
+import sys
+import tempfile
+import warnings
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from sklearn.ensemble import RandomForestClassifier
+
+from . import feature_store, reports
+from .analytics import DataAnalyzer
+from .management.commands import analyze_csvs
+from .csv_reader import iter_csv, read_csv, sniff_csv
+from .datasets import (
+    classify_tier,
+    dataset_dir,
+    scan_file,
+    register_upload,
+    release_upload,
+    uploads_index,
+)
+from .dedup import drop_duplicate_rows, unique_rows_mask
+from .incremental import (
+    CorrelationAccumulator,
+    DatasetStats,
+    apply_append,
+    find_base_upload,
+    load_stats,
+)
+from .lazy_dataset import LazyDataset, build_column_cache
+from .inference import FeatureSchema, hps_id
+from .ml_models import _get_model, _get_preprocessor
+from .profiling import summarize
+from .rendering import figures_dir, remove_unused_figures
+from .reports import save_report
+from .sketches import HyperLogLog, MisraGries, TDigest, sketch_chunks, split_frame
+
+
+def _dense(matrix):
+    return matrix.toarray() if hasattr(matrix, "toarray") else np.asarray(matrix)
+
+
+class FeatureSchemaTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        n = 60
+        self.X = pd.DataFrame(
+            {
+                "idade": rng.integers(18, 80, n).astype(float),
+                "vazia": np.nan,
+                "orcamento": rng.normal(1e6, 2e5, n),
+                "genero": rng.choice(["Ação", "Drama", "Comédia"], n),
+                "pais": rng.choice(["BR", "US"], n),
+            }
+        )
+        self.X.loc[::7, "orcamento"] = np.nan
+        with warnings.catch_warnings():
+            # O SimpleImputer avisa que descartou a coluna só com nulos.
+            warnings.simplefilter("ignore", UserWarning)
+            self.preprocessor = _get_preprocessor(self.X).fit(self.X)
+        self.schema = FeatureSchema.from_preprocessor(self.preprocessor)
+
+    def assert_same_as_preprocessor(self, features: dict, row: dict):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning)
+            expected = _dense(self.preprocessor.transform(pd.DataFrame([row])))
+        np.testing.assert_allclose(self.schema.transform(features), expected)
+
+    def test_matches_column_transformer(self):
+        self.assert_same_as_preprocessor(
+            {
+                "idade": "35",
+                "vazia": "",
+                "orcamento": "1200000",
+                "genero": "Drama",
+                "pais": "BR",
+            },
+            {
+                "idade": 35.0,
+                "vazia": np.nan,
+                "orcamento": 1.2e6,
+                "genero": "Drama",
+                "pais": "BR",
+            },
+        )
+
+    def test_missing_and_unknown_values(self):
+        self.assert_same_as_preprocessor(
+            {"idade": "", "genero": "Terror"},
+            {
+                "idade": np.nan,
+                "vazia": np.nan,
+                "orcamento": np.nan,
+                "genero": "Terror",
+                "pais": np.nan,
+            },
+        )
+
+    def test_all_nan_column_is_skipped(self):
+        self.assertNotIn("vazia", self.schema.columns)
+        self.assertEqual(
+            self.schema.n_outputs,
+            _dense(self.preprocessor.transform(self.X.head(1))).shape[1],
+        )
+
+
+class CsvReaderTests(SimpleTestCase):
+    def write(self, content: bytes) -> str:
+        fd, path = tempfile.mkstemp(suffix=".csv")
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_text_only_file_keeps_header(self):
+        path = self.write(
+            "titulo,genero,diretor\nMatrix,Ação,Wachowski\nAlien,Terror,Scott\n".encode()
+        )
+        self.assertTrue(sniff_csv(path)["header"])
+        df, _ = read_csv(path)
+        self.assertEqual(list(df.columns), ["titulo", "genero", "diretor"])
+
+    def test_numeric_file_without_header(self):
+        path = self.write(b"1,2.5\n3,4.5\n5,6\n")
+        self.assertFalse(sniff_csv(path)["header"])
+        df, _ = read_csv(path)
+        self.assertEqual(len(df), 3)
+
+    def test_latin1_after_ascii_prefix(self):
+        rows = "\n".join(["cidade,valor"] + [f"Rio,{i}" for i in range(20_000)])
+        path = self.write(rows.encode() + "\nSão Paulo,1\n".encode("latin-1"))
+        df, info = read_csv(path)
+        self.assertEqual(info["encoding"], "cp1252")
+        self.assertEqual(df["cidade"].iloc[-1], "São Paulo")
+        last = list(iter_csv(path, chunksize=5_000))[-1]
+        self.assertEqual(last["cidade"].iloc[-1], "São Paulo")
+
+
+class SketchTests(SimpleTestCase):
+    """Os sketches unidos por `merge` respeitam os limites de erro documentados."""
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.values = pd.Series(rng.zipf(1.3, 200_000) % 50_000)
+        self.chunks = list(split_frame(self.values.to_frame("v"), 20_000))
+
+    def merged(self, factory):
+        sketch = factory()
+        for chunk in self.chunks:
+            part = factory()
+            part.add(chunk["v"])
+            sketch.merge(part)
+        return sketch
+
+    def test_hyperloglog_distinct_count(self):
+        sketch = self.merged(HyperLogLog)
+        exact = self.values.nunique()
+        self.assertLess(abs(sketch.count() - exact) / exact, 4 * sketch.relative_error)
+
+    def test_hyperloglog_ignores_int_float_dtype(self):
+        # Blocos de uma coluna inteira com nulos chegam como float64.
+        ids = pd.Series(np.arange(5_000))
+        mixed, ints = HyperLogLog(), HyperLogLog()
+        for i, chunk in enumerate(split_frame(ids.to_frame("v"), 500)):
+            values = chunk["v"]
+            ints.add(values)
+            if i % 2:
+                values = pd.concat([values.astype(float), pd.Series([np.nan])])
+            mixed.add(values)
+        np.testing.assert_array_equal(mixed.registers, ints.registers)
+        self.assertLess(abs(mixed.count() - 5_000) / 5_000, 4 * mixed.relative_error)
+
+    def test_misra_gries_counts(self):
+        sketch = self.merged(lambda: MisraGries(k=100))
+        exact = self.values.value_counts()
+        self.assertFalse(sketch.is_exact)
+        self.assertEqual(sketch.n, len(self.values))
+        self.assertLessEqual(sketch.error, sketch.n / (sketch.k + 1))
+        estimated = pd.Series(sketch.counters, dtype="int64").reindex(
+            exact.index, fill_value=0
+        )
+        self.assertTrue((estimated <= exact).all())
+        self.assertTrue((exact - estimated <= sketch.error).all())
+
+    def test_misra_gries_exact_with_few_values(self):
+        values = self.values % 10
+        sketch = MisraGries(k=20)
+        for chunk in split_frame(values.to_frame("v"), 20_000):
+            sketch.add(chunk["v"])
+        self.assertTrue(sketch.is_exact)
+        self.assertEqual(sketch.counters, values.value_counts().to_dict())
+
+    def test_tdigest_quantiles(self):
+        values = pd.Series(np.random.default_rng(1).lognormal(size=200_000))
+        sketch = TDigest()
+        for chunk in split_frame(values.to_frame("v"), 20_000):
+            part = TDigest()
+            part.add(chunk["v"])
+            sketch.merge(part)
+        ordered = np.sort(values.to_numpy())
+        for q in (0.01, 0.25, 0.5, 0.75, 0.99):
+            rank = np.searchsorted(ordered, sketch.quantile(q)) / len(ordered)
+            self.assertLess(abs(rank - q), 0.01, q)
+
+    def test_parallel_chunks_match_serial(self):
+        serial = sketch_chunks(iter(self.chunks))["v"]
+        parallel = sketch_chunks(iter(self.chunks), workers=2)["v"]
+        self.assertEqual(parallel.rows, len(self.values))
+        self.assertEqual(parallel.heavy_hitters.n, serial.heavy_hitters.n)
+        np.testing.assert_array_equal(
+            parallel.distinct.registers, serial.distinct.registers
+        )
+        self.assertAlmostEqual(parallel.moments.mean, self.values.mean())
+
+
+class CorrelationAccumulatorTests(SimpleTestCase):
+    def test_matches_dataframe_corr_across_appends(self):
+        rng = np.random.default_rng(0)
+        n = 5_000
+        x = rng.normal(size=n)
+        df = pd.DataFrame(
+            {
+                "x": x,
+                "y": 2 * x + rng.normal(size=n),
+                "z": rng.integers(0, 100, n).astype(float),
+                "constante": 0.1,
+            }
+        )
+        df.loc[rng.random(n) < 0.1, "y"] = np.nan
+        df.loc[rng.random(n) < 0.2, "z"] = np.nan
+
+        accumulator = CorrelationAccumulator(df.columns)
+        for chunk in split_frame(df, 1_200):
+            accumulator.add(chunk)
+        pd.testing.assert_frame_equal(accumulator.corr(), df.corr(), atol=1e-9)
+
+    def test_large_offset_keeps_precision(self):
+        rng = np.random.default_rng(1)
+        n = 20_000
+        noise = rng.normal(size=n)
+        df = pd.DataFrame(
+            {
+                "timestamp": 1.7e9 + noise,
+                "centavos": 4.2e11 + 3 * noise + rng.normal(scale=0.3, size=n),
+                "ruido": rng.normal(size=n),
+            }
+        )
+        df.loc[rng.random(n) < 0.05, "centavos"] = np.nan
+
+        accumulator = CorrelationAccumulator(df.columns)
+        for chunk in split_frame(df, 3_000):
+            accumulator.add(chunk)
+        # Com o deslocamento subtraído (exato: valores próximos), o próprio
+        # `df.corr()` fica livre do erro de arredondamento do deslocamento.
+        expected = (df - df.iloc[0]).corr()
+        self.assertGreater(expected.loc["timestamp", "centavos"], 0.99)
+        pd.testing.assert_frame_equal(accumulator.corr(), expected, atol=1e-9)
+
+
+class DedupTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        n = 3_000
+        self.df = pd.DataFrame(
+            {
+                "a": rng.integers(0, 5, n).astype(float),
+                "b": rng.choice(["x", "y", None], n),
+                "c": rng.choice([0.0, -0.0, 1.5, np.nan], n),
+            }
+        )
+
+    def test_matches_drop_duplicates(self):
+        deduped, info = drop_duplicate_rows(self.df)
+        expected = self.df.drop_duplicates().reset_index(drop=True)
+        pd.testing.assert_frame_equal(deduped, expected)
+        self.assertEqual(info["removed"], len(self.df) - len(expected))
+        self.assertEqual(len(info["fingerprints"]), len(expected))
+
+    def test_negative_zero_is_duplicate(self):
+        df = pd.DataFrame({"v": [0.0, -0.0, 1.0]})
+        deduped, info = drop_duplicate_rows(df)
+        self.assertEqual(info["removed"], 1)
+        self.assertEqual(len(deduped), len(df.drop_duplicates()))
+
+    def test_forced_collisions_stay_exact(self):
+        # Todas as linhas com a mesma impressão: só a comparação exata decide.
+        colliding = np.zeros(len(self.df), dtype=np.uint64)
+        np.testing.assert_array_equal(
+            unique_rows_mask(self.df, colliding), ~self.df.duplicated().to_numpy()
+        )
+
+
+class FigureFileTests(SimpleTestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_html_figure_can_be_framed_by_same_origin(self):
+        name = "0" * 32 + ".html"
+        with open(os.path.join(figures_dir(), name), "w", encoding="utf-8") as fh:
+            fh.write("<div></div>")
+        response = self.client.get(reverse("figure_file", args=[name]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Frame-Options"], "SAMEORIGIN")
+        response.close()
+
+
+@override_settings(
+    ML_KNN_MAX_ROWS=1_000, ML_KNN_KDTREE_MAX_FEATURES=15, ML_KNN_SVD_COMPONENTS=50
+)
+class KnnEngineTests(SimpleTestCase):
+    def test_small_base_keeps_default_estimator(self):
+        model, _ = _get_model("KNN", {"n_neighbors": "3"}, n_rows=500, n_features=80)
+        self.assertEqual(model.algorithm, "auto")
+        self.assertEqual(model.n_neighbors, 3)
+
+    def test_large_base_with_few_features_uses_kd_tree(self):
+        model, _ = _get_model("KNN", {}, n_rows=5_000, n_features=15)
+        self.assertEqual(model.algorithm, "kd_tree")
+
+    def test_large_base_with_many_features_projects_then_brute_force(self):
+        model, engine = _get_model("KNN", {}, n_rows=5_000, n_features=120)
+        self.assertEqual(model.named_steps["svd"].n_components, 50)
+        self.assertEqual(model.named_steps["knn"].algorithm, "brute")
+        self.assertIn("força bruta", engine)
+
+
+class CachedReportViewTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_cached_visit_keeps_csv_details(self):
+        content = "nome;valor\nana;1\nbia;2\nana;1\n".encode("latin-1")
+        self.client.post(
+            reverse("upload"),
+            {"csv_file": SimpleUploadedFile("dados.csv", content)},
+        )
+        first = self.client.get(reverse("analysis"))
+        cached = self.client.get(reverse("analysis"))
+        self.assertTrue(cached.context["full_report_ready"])
+        for name in ("csv_info", "duplicates_removed", "dataset_columns"):
+            self.assertEqual(cached.context[name], first.context[name])
+        self.assertEqual(cached.context["csv_info"]["sep"], ";")
+        self.assertEqual(cached.context["duplicates_removed"], 1)
+
+
+class FeatureStoreTests(SimpleTestCase):
+    key = "a" * 32
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        feature_store._cache.clear()
+        self.addCleanup(feature_store._cache.clear)
+
+        rng = np.random.default_rng(0)
+        n = 200
+        self.X = pd.DataFrame(
+            {
+                "idade": rng.integers(18, 80, n).astype(float),
+                "genero": rng.choice(["Ação", "Drama", "Comédia"], n),
+            }
+        )
+        self.Y = pd.Series(rng.choice(["sim", "nao"], n))
+        self.builds = 0
+
+    def load_xy(self):
+        self.builds += 1
+        return self.X, self.Y
+
+    def get(self):
+        return feature_store.get_feature_set(self.key, self.load_xy, _get_preprocessor)
+
+    def assert_same(self, loaded, built):
+        np.testing.assert_array_equal(loaded.train_idx, built.train_idx)
+        np.testing.assert_array_equal(loaded.Y_test, built.Y_test)
+        np.testing.assert_allclose(_dense(loaded.X_train), _dense(built.X_train))
+        np.testing.assert_allclose(_dense(loaded.X_test), _dense(built.X_test))
+        self.assertEqual(
+            list(loaded.label_encoder.classes_), list(built.label_encoder.classes_)
+        )
+
+    def test_round_trip_dense_and_sparse(self):
+        built = feature_store.build_feature_set(
+            self.X, self.Y, _get_preprocessor(self.X)
+        )
+        for as_sparse in (False, True):
+            if as_sparse:
+                built.X_train = sp.csr_matrix(built.X_train)
+                built.X_test = sp.csr_matrix(built.X_test)
+            feature_store.save_feature_set(self.key, built)
+            loaded = feature_store.load_feature_set(self.key)
+            self.assertEqual(sp.issparse(loaded.X_train), as_sparse)
+            self.assert_same(loaded, built)
+
+    def test_memory_and_disk_cache_hits(self):
+        built = self.get()
+        self.assertIs(self.get(), built)
+        feature_store._cache.clear()
+        self.assert_same(self.get(), built)
+        self.assertEqual(self.builds, 1)
+
+    def test_outdated_set_is_replaced(self):
+        directory = feature_store._features_dir(self.key)
+        os.makedirs(directory)
+        with open(os.path.join(directory, "X_train.npy"), "wb") as fh:
+            fh.write(b"incompleto")
+        self.get()
+        feature_store._cache.clear()
+        self.get()
+        self.assertEqual(self.builds, 1)
+        parent = os.path.dirname(directory)
+        self.assertEqual(
+            [n for n in os.listdir(parent) if n.endswith((".tmp", ".old"))], []
+        )
+
+
+class ProfilingTests(SimpleTestCase):
+    def test_category_times_do_not_exceed_total(self):
+        rng = np.random.default_rng(0)
+        X = rng.normal(size=(2_000, 4))
+        y = (X[:, 0] > 0).astype(int)
+        profile = cProfile.Profile()
+        profile.enable()
+        # O `fit` de cada árvore é chamado pelo da floresta através do joblib.
+        RandomForestClassifier(n_estimators=20, random_state=0).fit(X, y).predict(X)
+        profile.disable()
+
+        total = pstats.Stats(profile).total_tt
+        categories = summarize(profile)["categorias"]
+        self.assertGreater(categories["sklearn fit/predict"], 0)
+        for seconds in categories.values():
+            self.assertLessEqual(seconds, round(total, 4) + 1e-4)
+
+
+def _register_many(worker: int):
+    for i in range(25):
+        register_upload("c" * 32, f"uploads/{worker}-{i}.csv")
+
+
+class UploadsIndexTests(SimpleTestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_last_release_removes_dataset_directory(self):
+        key = "d" * 32
+        register_upload(key, "uploads/a.csv")
+        register_upload(key, "uploads/b.csv")
+        for name in ("features", "colunas", "figuras"):
+            os.makedirs(os.path.join(dataset_dir(key), name))
+        directory = dataset_dir(key)
+
+        self.assertIsNone(release_upload("uploads/a.csv"))
+        self.assertTrue(os.path.isdir(directory))
+        self.assertEqual(release_upload("uploads/b.csv"), key)
+        self.assertFalse(os.path.exists(directory))
+        self.assertEqual(
+            sorted(os.listdir(os.path.dirname(directory))),
+            ["uploads.json", "uploads.lock"],
+        )
+
+    def test_concurrent_processes_keep_every_registration(self):
+        if "fork" not in multiprocessing.get_all_start_methods():
+            self.skipTest("precisa de fork para herdar o MEDIA_ROOT do teste")
+        with multiprocessing.get_context("fork").Pool(4) as pool:
+            pool.map(_register_many, range(4))
+        self.assertEqual(len(uploads_index()), 100)
+
+
+class UnusedFiguresTests(SimpleTestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_only_unreferenced_old_figures_are_removed(self):
+        used, unused, recent = (
+            "1" * 32 + ".png",
+            "2" * 32 + ".png",
+            "3" * 32 + ".html",
+        )
+        for name in (used, unused, recent):
+            path = os.path.join(figures_dir(), name)
+            with open(path, "wb") as fh:
+                fh.write(b"x")
+            if name != recent:
+                os.utime(path, (0, 0))
+        save_report(
+            "e" * 32, {"Geral": [{"image": f"/figuras/{used}"}]}, "estatico-png"
+        )
+
+        self.assertEqual(remove_unused_figures(), 1)
+        self.assertEqual(sorted(os.listdir(figures_dir())), sorted([used, recent]))
+
+
+class PredictionApiTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        rows = ["idade,genero,classe"] + [
+            f"{20 + i % 40},{'AB'[i % 2]},{'sim' if i % 3 else 'nao'}"
+            for i in range(60)
+        ]
+        self.client.post(
+            reverse("upload"),
+            {"csv_file": SimpleUploadedFile("dados.csv", "\n".join(rows).encode())},
+        )
+        # O formulário envia os hiperparâmetros como texto.
+        self.client.post(
+            reverse("prediction"),
+            {"action": "retrain", "modelo": "KNN", "hp_n_neighbors": "5"},
+        )
+
+    def predict(self, **payload):
+        return self.client.post(
+            reverse("prediction_api"),
+            json.dumps({"modelo": "KNN", **payload}),
+            content_type="application/json",
+        )
+
+    def test_hps_id_ignores_value_types(self):
+        self.assertEqual(hps_id({"n_neighbors": "5"}), hps_id({"n_neighbors": 5}))
+        self.assertEqual(hps_id({"C": 5.0}), hps_id({"C": "5"}))
+        self.assertNotEqual(hps_id({"C": "0.5"}), hps_id({"C": "5"}))
+
+    def test_json_hps_find_model_trained_by_form(self):
+        for value in (5, 5.0, "5"):
+            response = self.predict(
+                features={"idade": 30, "genero": "A"}, hps={"n_neighbors": value}
+            )
+            self.assertEqual(response.status_code, 200, response.content)
+
+    def test_unknown_feature_is_rejected(self):
+        response = self.predict(features={"idad": 30, "genero": "A"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("idad", response.json()["erro"])
+
+
+@override_settings(
+    ANALYSIS_SMALL_MAX_ROWS=100, ANALYSIS_MEDIUM_MAX_ROWS=1_000, ANALYSIS_SAMPLE_ROWS=50
+)
+class AnalyzeCsvsTests(SimpleTestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def write_csv(self, name: str, n_rows: int) -> str:
+        rng = np.random.default_rng(n_rows)
+        path = os.path.join(self.media_root, name)
+        pd.DataFrame(
+            {"a": rng.normal(size=n_rows), "b": rng.choice(["x", "y"], n_rows)}
+        ).to_csv(path, index=False)
+        return path
+
+    def process(self, path, **kwargs):
+        return analyze_csvs.process_csv(
+            path, kwargs.pop("models", []), kwargs.pop("force", False), **kwargs
+        )
+
+    def test_skip_by_content_hash(self):
+        path = self.write_csv("pequeno.csv", 50)
+        self.assertEqual(self.process(path)["status"], "ok")
+        copy = os.path.join(self.media_root, "copia.csv")
+        shutil.copy(path, copy)
+        self.assertEqual(self.process(copy)["status"], "pulado")
+        self.assertEqual(self.process(path, force=True)["status"], "ok")
+
+    def test_tiers(self):
+        medium = self.process(self.write_csv("medio.csv", 500))
+        self.assertEqual((medium["tier"], medium["sample_rows"]), ("medio", 50))
+        self.assertFalse(medium["full"])
+
+        large_path = self.write_csv("grande.csv", 2_000)
+        large = self.process(large_path, models=["DecisionTree"])
+        self.assertEqual(large["tier"], "grande")
+        self.assertIn("--full", large["models"])
+        self.assertNotIn("columns", large)
+        self.assertTrue(
+            os.path.exists(
+                os.path.join(dataset_dir(large["dataset"]), "report-perfil.json")
+            )
+        )
+
+        # Um resumo parcial não impede a análise completa.
+        full = self.process(large_path, full=True)
+        self.assertEqual(full["status"], "ok")
+        self.assertTrue(full["full"])
+        self.assertIn("columns", full)
+        self.assertEqual(self.process(large_path, full=True)["status"], "pulado")
+
+    def test_lock_of_live_process_skips_and_stale_lock_is_ignored(self):
+        path = self.write_csv("pequeno.csv", 50)
+        lock_path = os.path.join(
+            dataset_dir(analyze_csvs.scan_file(path)["key"]), analyze_csvs.LOCK_FILENAME
+        )
+        with open(lock_path, "w") as fh:
+            fh.write(str(os.getpid()))
+        self.assertEqual(self.process(path)["status"], "pulado")
+
+        finished = subprocess.run(
+            [sys.executable, "-c", "import os; print(os.getpid())"],
+            capture_output=True,
+            text=True,
+        )
+        with open(lock_path, "w") as fh:
+            fh.write(finished.stdout.strip())
+        self.assertEqual(self.process(path)["status"], "ok")
+        self.assertFalse(os.path.exists(lock_path))
+
+    def test_bundle_without_report_is_not_created(self):
+        output = os.path.join(self.media_root, "saida")
+        analyze_csvs.Command()._copy_bundle("/x/dados.csv", "f" * 32, output)
+        self.assertFalse(os.path.exists(output))
+
+
+@override_settings(
+    ANALYSIS_SMALL_MAX_ROWS=100,
+    ANALYSIS_SMALL_MAX_BYTES=10_000,
+    ANALYSIS_MEDIUM_MAX_ROWS=1_000,
+    ANALYSIS_MEDIUM_MAX_BYTES=100_000,
+)
+class TierTests(SimpleTestCase):
+    def test_boundaries(self):
+        self.assertEqual(classify_tier(100, 10_000), "pequeno")
+        self.assertEqual(classify_tier(101, 10_000), "medio")
+        self.assertEqual(classify_tier(100, 10_001), "medio")
+        self.assertEqual(classify_tier(1_000, 100_000), "medio")
+        self.assertEqual(classify_tier(1_001, 10), "grande")
+        self.assertEqual(classify_tier(10, 100_001), "grande")
+
+
+@override_settings(
+    ANALYSIS_SMALL_MAX_ROWS=100, ANALYSIS_MEDIUM_MAX_ROWS=1_000, ANALYSIS_SAMPLE_ROWS=50
+)
+class ReportSelectionTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def upload(self, n_rows: int) -> str:
+        rng = np.random.default_rng(n_rows)
+        content = pd.DataFrame(
+            {"a": rng.normal(size=n_rows), "b": rng.choice(["x", "y"], n_rows)}
+        ).to_csv(index=False)
+        self.client.post(
+            reverse("upload"),
+            {"csv_file": SimpleUploadedFile("dados.csv", content.encode())},
+        )
+        return self.client.session["dataset_key"]
+
+    def analysed_sample_size(self):
+        with mock.patch.object(
+            DataAnalyzer, "from_dataset", wraps=DataAnalyzer.from_dataset
+        ) as from_dataset:
+            self.client.get(reverse("analysis"))
+        return from_dataset.call_args.kwargs["sample_size"]
+
+    def test_small_file_gets_full_analysis(self):
+        self.upload(50)
+        self.assertIsNone(self.analysed_sample_size())
+
+    def test_medium_file_is_sampled(self):
+        self.upload(500)
+        self.assertEqual(self.analysed_sample_size(), 50)
+
+    def test_large_file_gets_profile_until_full_report_is_ready(self):
+        key = self.upload(2_000)
+        response = self.client.get(reverse("analysis"))
+        self.assertFalse(response.context["full_report_ready"])
+        self.assertIsNotNone(reports.load_report(key, variant="perfil"))
+        self.assertIsNone(reports.load_report(key))
+
+        self.client.post(reverse("analysis"), {"action": "full_report"})
+        reports._futures[key].result(timeout=60)
+        response = self.client.get(reverse("analysis"))
+        self.assertTrue(response.context["full_report_ready"])
+        self.assertEqual(response.context["grouped_plots"], reports.load_report(key))
+
+
+class AppendTests(SimpleTestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        os.makedirs(os.path.join(self.media_root, "uploads"))
+
+    def lines(self, n: int, seed: int) -> list[str]:
+        rng = np.random.default_rng(seed)
+        return [
+            f"{rng.integers(0, 20)},{rng.choice(['x', 'y', ''])},"
+            f"2024-01-{rng.integers(1, 29):02d},{rng.normal() * 1e3 + 1.7e9:.3f}"
+            for _ in range(n)
+        ]
+
+    def write(self, name: str, lines: list[str]) -> str:
+        path = os.path.join(self.media_root, "uploads", name)
+        with open(path, "w", encoding="utf-8") as fh:
+            fh.write("\n".join(["valor,grupo,data,instante"] + lines) + "\n")
+        return path
+
+    def test_appended_cache_equals_full_rebuild(self):
+        old_lines = self.lines(300, 0)
+        # Linhas novas repetindo antigas e repetidas entre si.
+        new_lines = self.lines(100, 1) + old_lines[:10] + self.lines(5, 1)
+        base_path = self.write("base.csv", old_lines)
+        base_key = scan_file(base_path)["key"]
+        LazyDataset(base_key, base_path).manifest
+        register_upload(base_key, "uploads/base.csv")
+
+        new_path = self.write("novo.csv", old_lines + new_lines)
+        scan = scan_file(new_path)
+        base = find_base_upload(new_path, scan, self.media_root)
+        self.assertEqual(base["key"], base_key)
+        self.assertTrue(apply_append(base, scan["key"], new_path))
+        appended = LazyDataset(scan["key"])
+
+        rebuilt_key = "0" * 32
+        build_column_cache(rebuilt_key, new_path)
+        rebuilt = LazyDataset(rebuilt_key)
+
+        pd.testing.assert_frame_equal(appended.load(), rebuilt.load())
+        self.assertEqual(appended.duplicates_removed, rebuilt.duplicates_removed)
+        np.testing.assert_array_equal(appended.row_mask(), rebuilt.row_mask())
+        np.testing.assert_array_equal(
+            appended.row_fingerprints(), rebuilt.row_fingerprints()
+        )
+
+        stats = load_stats(scan["key"])
+        expected = DatasetStats.from_frame(rebuilt.load())
+        self.assertEqual(stats.parent_key, base_key)
+        self.assertEqual(stats.n_rows, expected.n_rows)
+        pd.testing.assert_frame_equal(
+            stats.correlation.corr(), expected.correlation.corr(), atol=1e-9
+        )
+        for col in expected.daily:
+            pd.testing.assert_series_equal(
+                stats.daily_counts(col), expected.daily_counts(col), check_names=False
+            )
+        for col, sketch in expected.sketches.items():
+            self.assertEqual(stats.sketches[col].rows, sketch.rows)
+            self.assertEqual(stats.sketches[col].nunique(), sketch.nunique())
+            if sketch.numeric:
+                # Médias combinadas por blocos diferem só no último bit.
+                self.assertTrue(
+                    np.isclose(
+                        stats.sketches[col].moments.mean,
+                        sketch.moments.mean,
+                        rtol=1e-12,
+                    )
+                )
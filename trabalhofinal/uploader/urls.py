@@ -5,4 +5,14 @@ urlpatterns = [
     path('', views.upload_file, name='upload'),
     path('analise/', views.analysis_view, name='analysis'),
     path('predicao/', views.prediction_view, name='prediction'),
+    path('predicao/api/', views.prediction_api, name='prediction_api'),
+    path('figuras/<str:name>', views.figure_file, name='figure_file'),
+    path('perfis/', views.profiles_view, name='profiles'),
+    path('perfis/<str:key>/', views.profiles_view, name='profiles_dataset'),
+    path('perfis/<str:key>/<str:profile_id>/', views.profiles_view, name='profile_detail'),
+    path(
+        'perfis/<str:key>/<str:profile_id>/<str:filename>',
+        views.profile_download,
+        name='profile_download',
+    ),
 ]
\ No newline at end of file
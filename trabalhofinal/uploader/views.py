@@ -1,11 +1,181 @@
 from django.shortcuts import render, redirect
-import pandas as pd
+from django.http import FileResponse, Http404, JsonResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.views.decorators.clickjacking import xframe_options_sameorigin
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 import io
+import json
 import os
+import shutil
+import tempfile
+import time
 from django.conf import settings
+from django.core.files import File
 from django.core.files.storage import default_storage
-from .analytics import DataAnalyzer
+from .analytics import DataAnalyzer, clean_column_name, profile_stream
+from .csv_reader import iter_csv, read_csv, sniff_csv
+from .datasets import (
+    TIER_LARGE,
+    TIER_MEDIUM,
+    TIER_SMALL,
+    DATASET_KEY,
+    classify_tier,
+    get_analyzer_options,
+    get_tier_limits,
+    register_upload,
+    release_upload,
+    scan_file,
+)
+from .incremental import apply_append, find_base_upload, load_stats
+from .inference import MODEL_NAMES, get_model
+from .lazy_dataset import LazyDataset
 from .ml_models import run_ml_task
+from .profiling import (
+    list_profiles,
+    load_profile,
+    profile_file_path,
+    profile_request,
+)
+from .rendering import (
+    FIGURE_NAME,
+    HAS_KALEIDO,
+    StaticRenderer,
+    figures_dir,
+    remove_unused_figures,
+)
+from .reports import (
+    STATUS_FAILED,
+    STATUS_READY,
+    STATUS_RUNNING,
+    collect_plots,
+    group_plots,
+    load_report,
+    report_status,
+    request_full_report,
+    save_report,
+)
+
+TIER_LABELS = {
+    TIER_SMALL: "Pequeno (relatório completo)",
+    TIER_MEDIUM: "Médio (gráficos amostrados e estatísticas aproximadas)",
+    TIER_LARGE: "Grande (apenas perfil em streaming)",
+}
+
+
+def _tier_info(request):
+    """
+    Monta o contexto exibido ao usuário sobre a faixa de processamento do
+    arquivo atual e os limites configurados.
+    """
+    tier = request.session.get("dataset_tier", TIER_SMALL)
+    limits = get_tier_limits()
+    return {
+        "tier": tier,
+        "label": TIER_LABELS.get(tier, tier),
+        "rows": request.session.get("dataset_rows"),
+        "bytes": request.session.get("dataset_bytes"),
+        "small_max_rows": limits[TIER_SMALL]["max_rows"],
+        "small_max_bytes": limits[TIER_SMALL]["max_bytes"],
+        "medium_max_rows": limits[TIER_MEDIUM]["max_rows"],
+        "medium_max_bytes": limits[TIER_MEDIUM]["max_bytes"],
+        "sample_rows": getattr(settings, "ANALYSIS_SAMPLE_ROWS", 20_000),
+    }
+
+
+def _session_dataset(request, full_fs_path) -> LazyDataset:
+    """
+    Handle preguiçoso do dataset da sessão; sessões antigas, sem a chave
+    de conteúdo, recebem uma aqui.
+    """
+    dataset_key = request.session.get("dataset_key")
+    if not dataset_key:
+        dataset_key = scan_file(full_fs_path)["key"]
+        request.session["dataset_key"] = dataset_key
+    return LazyDataset(dataset_key, full_fs_path, request.session.get("csv_format"))
+
+
+def _cached_dataset_context(dataset_key) -> dict:
+    """
+    Informações de leitura do CSV guardadas no manifesto do cache colunar,
+    para as visitas servidas de um relatório pronto (sem construir o cache).
+    """
+    try:
+        dataset = LazyDataset(dataset_key)
+        return {
+            "csv_info": dataset.csv_info,
+            "duplicates_removed": dataset.duplicates_removed,
+            "dataset_columns": dataset.columns,
+        }
+    except FileNotFoundError:
+        return {}
+
+
+def _render_mode(request) -> str:
+    """
+    Modo de exibição dos gráficos: `?modo=estatico` ou `?modo=interativo`
+    (lembrado na sessão), senão o ANALYSIS_RENDER_MODE do settings.
+    """
+    mode = request.GET.get("modo")
+    if mode in ("estatico", "interativo"):
+        request.session["render_mode"] = mode
+    return request.session.get("render_mode") or getattr(
+        settings, "ANALYSIS_RENDER_MODE", "interativo"
+    )
+
+
+def _static_renderer(request) -> StaticRenderer | None:
+    # Os gráficos do DataAnalyzer são Plotly: sem o kaleido não há imagens.
+    if _render_mode(request) != "estatico" or not HAS_KALEIDO:
+        return None
+    return StaticRenderer(getattr(settings, "ANALYSIS_STATIC_FORMAT", "png"))
+
+
+def _render_mode_context(request, renderer) -> dict:
+    return {
+        "static_mode": renderer is not None,
+        "static_available": HAS_KALEIDO,
+        "static_requested": _render_mode(request) == "estatico",
+    }
+
+
+def _save_appended_upload(request, f):
+    """
+    Modo "acrescentar": grava um novo upload com o conteúdo do arquivo atual
+    da sessão seguido das linhas enviadas (sem repetir o cabeçalho). Devolve
+    o caminho salvo e o dataset base `{"key", "n_bytes"}`.
+    """
+    old_path = request.session.get("file_path")
+    if not old_path or not default_storage.exists(old_path):
+        raise Exception("Não há arquivo atual para acrescentar linhas.")
+    csv_format = request.session.get("csv_format") or {}
+
+    with tempfile.TemporaryFile() as tmp:
+        with default_storage.open(old_path, "rb") as old:
+            shutil.copyfileobj(old, tmp)
+            old.seek(0)
+            old_header = old.readline().strip()
+        base_bytes = tmp.tell()
+        if base_bytes:
+            tmp.seek(-1, os.SEEK_END)
+            if tmp.read(1) != b"\n":
+                tmp.write(b"\n")
+                base_bytes += 1
+
+        lines = iter(f.open("rb"))
+        first = next(lines, b"")
+        if not (csv_format.get("header") and first.strip() == old_header):
+            tmp.write(first)
+        for line in lines:
+            tmp.write(line)
+
+        tmp.seek(0)
+        actual_path = default_storage.save(old_path, File(tmp, name=f.name))
+
+    base = {"key": request.session.get("dataset_key"), "n_bytes": base_bytes}
+    if not base["key"]:
+        base["key"] = scan_file(os.path.join(settings.MEDIA_ROOT, old_path))["key"]
+    return actual_path, base
 
 
 def upload_file(request):
@@ -17,23 +187,48 @@ def upload_file(request):
             )
 
         try:
-            save_path = os.path.join('uploads', f.name)
-            actual_path = default_storage.save(save_path, f)
+            base = None
+            if request.POST.get("modo") == "acrescentar":
+                actual_path, base = _save_appended_upload(request, f)
+                csv_format = request.session.get("csv_format")
+            else:
+                save_path = os.path.join('uploads', f.name)
+                actual_path = default_storage.save(save_path, f)
+                csv_format = None
             full_fs_path = os.path.join(settings.MEDIA_ROOT, actual_path)
 
-            df = pd.read_csv(full_fs_path, encoding="utf-8", on_bad_lines="skip")
-            
+            # Lê só o início do arquivo para validar e obter as colunas; o
+            # tamanho real é medido em streaming, sem carregar tudo na memória.
+            csv_format = csv_format or sniff_csv(full_fs_path)
+            df, _ = read_csv(full_fs_path, nrows=100, fmt=csv_format)
+            scan = scan_file(full_fs_path)
+
+            # Reenvio do mesmo CSV com linhas novas no fim: só elas são
+            # processadas, a partir do cache e das estatísticas do anterior.
+            if base is None:
+                base = find_base_upload(full_fs_path, scan, settings.MEDIA_ROOT)
+            if base and not LazyDataset.exists(scan["key"]):
+                apply_append(base, scan["key"], full_fs_path)
+
             request.session["file_path"] = actual_path
+            request.session["csv_format"] = csv_format
             request.session["df_columns"] = list(df.columns)
+            request.session["dataset_key"] = scan["key"]
+            register_upload(scan["key"], actual_path)
+            request.session["dataset_rows"] = scan["n_rows"]
+            request.session["dataset_bytes"] = scan["n_bytes"]
+            request.session["dataset_tier"] = classify_tier(
+                scan["n_rows"], scan["n_bytes"]
+            )
             request.session.pop("dataframe", None)
             
             try:
                 upload_dir_name = 'uploads'
-                max_files = 3
+                max_files = getattr(settings, "UPLOADS_MAX_FILES", 3)
                 _, filenames = default_storage.listdir(upload_dir_name)
                 csv_files = [os.path.join(upload_dir_name, f) for f in filenames if f.lower().endswith('.csv')]
                 
-                if len(csv_files) > max_files:
+                if max_files is not None and len(csv_files) > max_files:
                     files_with_mtime = []
                     for path in csv_files:
                         try:
@@ -52,6 +247,10 @@ def upload_file(request):
                             default_storage.delete(path)
                         except (IOError, FileNotFoundError):
                             continue
+                        # Último upload do dataset apagado: libera todos os
+                        # caches e artefatos dele e as figuras que só ele usava.
+                        if release_upload(path):
+                            remove_unused_figures()
             except (IOError, FileNotFoundError) as e:
                 print(f"Erro de E/S na limpeza de arquivos: {e}")
                 pass
@@ -70,9 +269,14 @@ def upload_file(request):
                 {"error": f"Erro ao processar o arquivo: {e}"},
             )
 
-    return render(request, "uploader/upload.html")
+    return render(
+        request,
+        "uploader/upload.html",
+        {"can_append": bool(request.session.get("file_path"))},
+    )
 
 
+@profile_request
 def analysis_view(request):
     file_path = request.session.get("file_path")
     if not file_path:
@@ -98,18 +302,68 @@ def analysis_view(request):
                 },
             )
 
-        df = pd.read_csv(full_fs_path, encoding="utf-8", on_bad_lines="skip")
+        tier_info = _tier_info(request)
+        dataset_key = request.session.get("dataset_key")
+        renderer = _static_renderer(request)
+        variant = renderer.variant if renderer else None
 
-        if df.empty:
+        # Relatórios pré-calculados (em segundo plano ou pelo comando
+        # `analyze_csvs`) são servidos sem nenhum processamento.
+        if dataset_key and tier_info["tier"] != TIER_LARGE and not request.GET.get("coluna"):
+            grouped_plots = load_report(dataset_key, variant)
+            if grouped_plots is not None:
+                return render(
+                    request,
+                    "uploader/analysis.html",
+                    {
+                        "grouped_plots": grouped_plots,
+                        "tier_info": tier_info,
+                        "full_report_ready": True,
+                        **_cached_dataset_context(dataset_key),
+                        **_render_mode_context(request, renderer),
+                    },
+                )
+
+        if tier_info["tier"] == TIER_LARGE and dataset_key:
+            if request.method == "POST" and request.POST.get("action") == "full_report":
+                request_full_report(dataset_key, full_fs_path)
+                return redirect("analysis")
+
+            status = report_status(dataset_key)
+            grouped_plots = load_report(dataset_key) if status == STATUS_READY else None
+            if grouped_plots is None:
+                # O perfil em streaming relê o arquivo inteiro: é calculado
+                # na primeira visita e servido do disco nas seguintes.
+                grouped_plots = load_report(dataset_key, variant="perfil")
+            if grouped_plots is None:
+                chunks = iter_csv(
+                    full_fs_path,
+                    chunksize=getattr(settings, "ANALYSIS_STREAM_CHUNK_ROWS", 100_000),
+                    fmt=request.session.get("csv_format"),
+                )
+                grouped_plots = group_plots(
+                    profile_stream(
+                        chunks, workers=getattr(settings, "ANALYSIS_SKETCH_WORKERS", 1)
+                    )
+                )
+                save_report(dataset_key, grouped_plots, variant="perfil")
             return render(
                 request,
                 "uploader/analysis.html",
-                {"plots": [], "error": "O DataFrame está vazio após o carregamento."},
+                {
+                    "grouped_plots": grouped_plots,
+                    "tier_info": tier_info,
+                    "full_report_status": status,
+                    "full_report_ready": status == STATUS_READY,
+                    "full_report_running": status == STATUS_RUNNING,
+                    "full_report_failed": status == STATUS_FAILED,
+                },
             )
 
-        analyzer = DataAnalyzer(df)
-
-        if analyzer.df.empty:
+        # Os dados limpos vêm do cache colunar; com ?coluna=<nome>, só essa
+        # coluna é carregada e analisada.
+        dataset = _session_dataset(request, full_fs_path)
+        if dataset.n_rows == 0:
             return render(
                 request,
                 "uploader/analysis.html",
@@ -119,24 +373,61 @@ def analysis_view(request):
                 },
             )
 
-        plots = []
-        plots.extend(analyzer.generate_basic_plots())
-        plots.extend(analyzer.generate_advanced_plots())
-        geo_plot = analyzer.generate_geo_visualization()
-        if geo_plot:
-            plots.append(geo_plot)
-        temporal_plots = analyzer.generate_temporal_plots()
-        plots.extend(temporal_plots)
-
-        grouped_plots = {}
-        for plot in plots:
-            section = plot.get("section", "Geral")
-            if section not in grouped_plots:
-                grouped_plots[section] = []
-            grouped_plots[section].append(plot)
+        selected_column = request.GET.get("coluna")
+        if selected_column:
+            selected_column = clean_column_name(selected_column)
+        if selected_column not in dataset.columns:
+            selected_column = None
+
+        sample_size = None
+        if tier_info["tier"] == TIER_MEDIUM:
+            sample_size = tier_info["sample_rows"]
+
+        # Dataset acrescido de linhas: estatísticas já atualizadas e os
+        # gráficos do relatório anterior, reaproveitados se nada mudou.
+        stats = load_stats(dataset.key)
+        figure_cache = {}
+        if stats is not None and stats.parent_key:
+            for plot_list in (load_report(stats.parent_key, variant) or {}).values():
+                figure_cache.update(
+                    {p["fingerprint"]: p for p in plot_list if "fingerprint" in p}
+                )
+
+        analyzer = DataAnalyzer.from_dataset(
+            dataset,
+            columns=[selected_column] if selected_column else None,
+            sample_size=sample_size,
+            stats=stats,
+            figure_cache=figure_cache,
+            renderer=renderer,
+            **get_analyzer_options(),
+        )
+
+        grouped_plots = group_plots(collect_plots(analyzer))
+        if not selected_column:
+            save_report(dataset.key, grouped_plots, variant)
+
+        append_info = None
+        if stats is not None and stats.parent_key:
+            append_info = {
+                "appended_rows": stats.appended_rows,
+                "reused_plots": analyzer.reused_plots,
+                "rendered_plots": analyzer.rendered_plots,
+            }
 
         return render(
-            request, "uploader/analysis.html", {"grouped_plots": grouped_plots}
+            request,
+            "uploader/analysis.html",
+            {
+                "grouped_plots": grouped_plots,
+                "tier_info": tier_info,
+                "csv_info": dataset.csv_info,
+                "duplicates_removed": dataset.duplicates_removed,
+                "dataset_columns": dataset.columns,
+                "selected_column": selected_column,
+                "append_info": append_info,
+                **_render_mode_context(request, renderer),
+            },
         )
 
     except Exception as e:
@@ -147,6 +438,7 @@ def analysis_view(request):
         )
 
 
+@profile_request
 def prediction_view(request):
     cols = request.session.get("df_columns") or []
 
@@ -183,22 +475,25 @@ def prediction_view(request):
             }
             return render(request, "uploader/prediction.html", ctx)
 
+        action = request.POST.get("action")
+        modelo = request.POST.get("modelo")
+
+        if modelo not in MODEL_NAMES:
+            ctx["prediction"] = {"output": "Modelo não selecionado.", "metrics": ""}
+            return render(request, "uploader/prediction.html", ctx)
+
+        hps = {k[3:]: v for k, v in request.POST.items() if k.startswith("hp_")}
+        xs = {k: v for k, v in request.POST.items() if k.startswith("X_")}
+
         try:
             full_fs_path = os.path.join(settings.MEDIA_ROOT, file_path)
             if not default_storage.exists(file_path):
                  raise Exception("Arquivo não encontrado ou expirado. Faça o upload novamente.")
-            
-            df = pd.read_csv(full_fs_path, encoding="utf-8", on_bad_lines="skip")
-            analyzer = DataAnalyzer(df)
-            df_clean = analyzer.df
-
-            if df_clean.empty or len(df_clean.columns) < 2:
-                ctx["prediction"] = {
-                    "output": "Erro: Os dados limpos estão vazios ou não têm colunas suficientes (mínimo 2).",
-                    "metrics": "",
-                }
-                return render(request, "uploader/prediction.html", ctx)
 
+            # Nada é lido aqui: com um modelo já treinado a predição não toca
+            # nos dados, e um treino só carrega as colunas se o feature store
+            # do dataset ainda não existir.
+            dataset = _session_dataset(request, full_fs_path)
         except Exception as e:
             ctx["prediction"] = {
                 "output": f"Erro ao ler dados da sessão: {e}",
@@ -206,18 +501,15 @@ def prediction_view(request):
             }
             return render(request, "uploader/prediction.html", ctx)
 
-        action = request.POST.get("action")
-        modelo = request.POST.get("modelo")
-
-        if not modelo:
-            ctx["prediction"] = {"output": "Modelo não selecionado.", "metrics": ""}
-            return render(request, "uploader/prediction.html", ctx)
-
-        hps = {k[3:]: v for k, v in request.POST.items() if k.startswith("hp_")}
-        xs = {k: v for k, v in request.POST.items() if k.startswith("X_")}
-
         try:
-            prediction_result = run_ml_task(df_clean, modelo, hps, xs, action)
+            prediction_result = run_ml_task(
+                dataset,
+                modelo,
+                hps,
+                xs,
+                action,
+                dataset_key=dataset.key,
+            )
             ctx["prediction"] = prediction_result
         except Exception as e:
             ctx["prediction"] = {
@@ -225,4 +517,128 @@ def prediction_view(request):
                 "metrics": "N/A",
             }
 
-    return render(request, "uploader/prediction.html", ctx)
\ No newline at end of file
+    return render(request, "uploader/prediction.html", ctx)
+
+@csrf_exempt
+@require_POST
+@profile_request
+def prediction_api(request):
+    """
+    Endpoint JSON de predição de baixa latência. Usa o modelo compilado no
+    último treino (ação "re-treinar" ou "prever" na página de predição);
+    nunca treina durante a requisição.
+
+    Corpo: {"modelo": "KNN", "features": {...}, "hps": {...}} ("hps" é
+    opcional). O dataset é sempre o da sessão: o endpoint não tem
+    autenticação, então o cliente não escolhe outro.
+    """
+    start = time.perf_counter()
+    try:
+        payload = json.loads(request.body or b"{}")
+    except ValueError:
+        return JsonResponse({"erro": "JSON inválido."}, status=400)
+    if not isinstance(payload, dict):
+        return JsonResponse({"erro": "O corpo deve ser um objeto JSON."}, status=400)
+
+    modelo = payload.get("modelo")
+    features = payload.get("features")
+    dataset_key = request.session.get("dataset_key")
+    if not modelo or not isinstance(features, dict):
+        return JsonResponse(
+            {"erro": 'Informe "modelo" e "features" (objeto coluna -> valor).'},
+            status=400,
+        )
+    if modelo not in MODEL_NAMES:
+        return JsonResponse(
+            {"erro": f'Modelo desconhecido. Use um de: {", ".join(MODEL_NAMES)}.'},
+            status=400,
+        )
+    if not dataset_key or not DATASET_KEY.match(dataset_key):
+        return JsonResponse(
+            {"erro": "Nenhum dataset na sessão. Faça o upload de um CSV."}, status=400
+        )
+    if payload.get("dataset") not in (None, dataset_key):
+        return JsonResponse(
+            {"erro": "Só é possível usar o dataset da sessão."}, status=403
+        )
+
+    hps = payload.get("hps")
+    compiled = get_model(dataset_key, modelo, hps if isinstance(hps, dict) else None)
+    if compiled is None:
+        return JsonResponse(
+            {"erro": f"Modelo {modelo} ainda não treinado para este dataset."},
+            status=404,
+        )
+
+    unknown = compiled.schema.unknown_columns(features)
+    if unknown:
+        return JsonResponse(
+            {
+                "erro": f'Colunas desconhecidas: {", ".join(unknown)}.',
+                "colunas": compiled.schema.columns,
+            },
+            status=400,
+        )
+
+    try:
+        row = compiled.schema.transform(features)
+        overhead = time.perf_counter() - start
+        model_start = time.perf_counter()
+        result = compiled.predict_row(row)
+        model_time = time.perf_counter() - model_start
+    except ValueError as e:
+        return JsonResponse({"erro": str(e)}, status=400)
+
+    return JsonResponse(
+        {
+            "classe": str(result["label"]),
+            "score": result["score"],
+            "probabilidades": result["probabilities"],
+            "metricas": compiled.metrics,
+            "tempo_modelo_ms": round(model_time * 1000, 3),
+            "tempo_overhead_ms": round(overhead * 1000, 3),
+        }
+    )
+
+
+@xframe_options_sameorigin
+def figure_file(request, name):
+    """
+    Serve as figuras do modo estático. Os nomes são derivados do conteúdo,
+    então podem ficar em cache no navegador e em proxies para sempre. As
+    versões `.html` (botão "Tornar interativo") abrem num iframe da própria
+    página, então a resposta permite enquadramento pela mesma origem.
+    """
+    if not FIGURE_NAME.match(name):
+        raise Http404
+    path = os.path.join(figures_dir(), name)
+    if not os.path.exists(path):
+        raise Http404
+    response = FileResponse(open(path, "rb"))
+    response["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+
+@staff_member_required
+def profiles_view(request, key=None, profile_id=None):
+    """
+    Perfis de desempenho gravados (`?perfil=1`) do dataset da sessão ou do
+    indicado na URL; com `profile_id`, o resumo de um perfil.
+    """
+    key = key or request.session.get("dataset_key")
+    ctx = {"dataset_key": key}
+    if key and profile_id:
+        ctx["profile"] = load_profile(key, profile_id)
+        if ctx["profile"] is None:
+            raise Http404
+    elif key:
+        ctx["profiles"] = list_profiles(key)
+    return render(request, "uploader/profiles.html", ctx)
+
+
+@staff_member_required
+def profile_download(request, key, profile_id, filename):
+    path = profile_file_path(key, profile_id, filename)
+    if path is None:
+        raise Http404
+    return FileResponse(open(path, "rb"), as_attachment=True, filename=filename)